@@ -0,0 +1,83 @@
+import os
+import random
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, Optional
+
+from board import Board
+from budget import SearchBudget
+from constants import EMPTY
+from solver import AlgXSudokuSolver
+from sudoku import Sudoku
+
+def encode_payload(sudoku:Sudoku) -> bytes :
+  """
+  Serialize a generated puzzle as its n^4 givens followed by its n^4 solution numbers, one signed byte each
+  """
+  solution = sudoku.board.copy()
+  for (r, c), num in sudoku.solution.items() :
+    solution[r][c] = num
+  return sudoku.board.cells.tobytes() + solution.cells.tobytes()
+
+def decode_payload(n:int, payload:bytes) -> Sudoku :
+  """
+  Rebuild the puzzle of order n serialized by encode_payload, with its solution over all cells
+  """
+  sudoku = Sudoku(n)
+  sudoku.board = Board(n, array('b', payload[:n**4]))
+  solution = array('b', payload[n**4:])
+  sudoku.solution = {divmod(i, n**2): num for i, num in enumerate(solution)}
+  return sudoku
+
+def generate_payload(n:int, difficulty:str, mode:str, symmetric:bool, oracle:str, seed:int, fill_mode:str="mrv",
+                     budget:Optional[SearchBudget]=None) -> bytes :
+  """
+  Generate one puzzle from its own seed and serialize it, this runs in the worker processes.
+  The puzzle gets the node limit of `budget` and whatever is left of its deadline
+  """
+  random.seed(seed)
+  sudoku = Sudoku(n)
+  deadline = node_budget = None
+  if budget is not None :
+    deadline = max(budget.deadline - time.time(), 0) if budget.deadline is not None else None
+    node_budget = budget.max_nodes
+  sudoku.generate_new_puzzle(difficulty, mode, symmetric, oracle=oracle, fill_mode=fill_mode, deadline=deadline, node_budget=node_budget)
+  return encode_payload(sudoku)
+
+def check_removal(n:int, cells:bytes, removed_cell_to_num:dict, oracle:str) -> bool :
+  """
+  Check if the puzzle of order n serialized in `cells` has another solution once the cells of `removed_cell_to_num` are emptied,
+  this runs in the worker processes
+  """
+  sudoku = Sudoku(n)
+  sudoku.board = Board(n, array('b', cells))
+  for r, c in removed_cell_to_num :
+    sudoku.board[r][c] = EMPTY
+  if oracle == "algx" :
+    return AlgXSudokuSolver(sudoku).has_other_solution(removed_cell_to_num)
+  return sudoku.has_other_solution(sudoku.board, removed_cell_to_num)
+
+def generate_batch(n:int, difficulty:str="medium", mode:str="linear", symmetric:bool=True, count:int=1, workers:Optional[int]=None,
+                   seed:Optional[int]=None, oracle:str="algx") -> Iterator[bytes] :
+  """
+  Generate `count` puzzles of order n over a pool of `workers` processes, yielding their encode_payload payloads as they finish.
+  Every puzzle gets its own seed drawn from `seed`, so a batch is reproducible whatever the scheduling of the workers.
+  At most a few puzzles per worker are in flight, so memory stays flat on large batches
+  """
+  workers = workers or os.cpu_count() or 1
+  rng = random.Random(seed)
+  seeds = (rng.getrandbits(64) for _ in range(count))
+  with ProcessPoolExecutor(max_workers=workers) as executor :
+    max_in_flight = 4 * workers
+    in_flight = set()
+    for puzzle_seed in seeds :
+      if len(in_flight) == max_in_flight :
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done :
+          yield future.result()
+      in_flight.add(executor.submit(generate_payload, n, difficulty, mode, symmetric, oracle, puzzle_seed))
+    while in_flight :
+      done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+      for future in done :
+        yield future.result()
@@ -0,0 +1,127 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from constants import EMPTY
+from solver import ALGX_BACKENDS, BACKTRACK_STRATEGIES, AlgXSudokuSolver, BacktrackSudokuSolver
+from sudoku import Sudoku
+
+def random_puzzle(n:int, removal_ratio:float, seed:int=0) -> Sudoku :
+  """
+  Build a random puzzle of order `n` by solving an empty board and emptying `removal_ratio` of its cells
+  """
+  random.seed(seed)
+  sudoku = Sudoku(n)
+  for (r, c), num in AlgXSudokuSolver(sudoku).solve().items() :
+    sudoku.board[r][c] = num
+  cells = sudoku.get_non_empty_cells(sudoku.board)
+  random.shuffle(cells)
+  for r, c in cells[:int(removal_ratio*len(cells))] :
+    sudoku.board[r][c] = EMPTY
+  return sudoku
+
+# Ratio of emptied cells per order, 25x25 puzzles with half of their cells emptied are often very hard for plain search
+REMOVAL_RATIOS = {1: .6, 2: .6, 3: .6, 4: .6, 5: .45}
+
+def bench_backends(n:int, repeats:int=5) -> None :
+  """
+  Compare the setup and search time of every AlgX backend on the same puzzle of order `n`,
+  checking that every decoded solution completes the puzzle into a valid board
+  """
+  sudoku = random_puzzle(n, REMOVAL_RATIOS[n])
+  for backend in ALGX_BACKENDS :
+    setup_time = solve_time = 0
+    for i in range(repeats) :
+      random.seed(i)
+      start = time.time()
+      solver = AlgXSudokuSolver(sudoku, backend)
+      setup_time += time.time() - start
+      start = time.time()
+      solution = solver.solve()
+      solve_time += time.time() - start
+      assert solution is not None
+      board = sudoku.board.copy()
+      for (r, c), num in solution.items() :
+        board[r][c] = num
+      assert not sudoku.get_empty_cells(board) and sudoku.is_board_valid(board)
+    print(f"n={n} {backend:>6}: setup {setup_time/repeats:.4f}s, solve {solve_time/repeats:.4f}s")
+
+def bench_memory(n:int) -> None :
+  """
+  Measure the peak memory allocated by one AlgX solve of a puzzle of order `n`, building the matrix of the order included.
+  A dense exact cover matrix would need at least one 8 bytes list slot per entry on top of it
+  """
+  sudoku = random_puzzle(n, REMOVAL_RATIOS[n])
+  AlgXSudokuSolver.ec_mats.clear()
+  tracemalloc.start()
+  AlgXSudokuSolver(sudoku).solve()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  dense_size = 8 * n**6 * 4*n**4
+  print(f"n={n} peak memory: {peak/2**20:.2f} MiB, dense matrix slots alone: {dense_size/2**20:.2f} MiB")
+
+def bench_backtrack(n:int, count:int=20, removal_ratio:float=.7) -> None :
+  """
+  Measure the throughput of the backtracking solver over a batch of `count` puzzles of order `n`
+  """
+  sudokus = [random_puzzle(n, removal_ratio, seed) for seed in range(count)]
+  solve_time = 0
+  for sudoku in sudokus :
+    start = time.time()
+    solution = BacktrackSudokuSolver(sudoku).solve()
+    solve_time += time.time() - start
+    assert solution is not None
+  print(f"n={n} backtrack: {count} puzzles in {solve_time:.4f}s, {count/solve_time:.1f} puzzles/s")
+
+def bench_strategies(n:int, count:int=20, removal_ratio:float=.7) -> None :
+  """
+  Count the search nodes and time of the backtracking solver over a batch of `count` puzzles of order `n`,
+  with singles only, with each elimination strategy on its own and with all of them
+  """
+  sudokus = [random_puzzle(n, removal_ratio, seed) for seed in range(count)]
+  configs = [()] + [(name,) for name in BACKTRACK_STRATEGIES] + [tuple(BACKTRACK_STRATEGIES)]
+  for strategies in configs :
+    n_nodes = solve_time = 0
+    for sudoku in sudokus :
+      start = time.time()
+      solver = BacktrackSudokuSolver(sudoku, strategies)
+      assert solver.solve() is not None
+      solve_time += time.time() - start
+      n_nodes += solver.n_nodes
+    name = "all" if len(strategies) > 1 else (strategies or ("singles",))[0]
+    print(f"n={n} {name:>14}: {n_nodes} nodes, {solve_time:.4f}s")
+
+def bench_generation(n:int, node_budget:int, count:int=5, difficulty:str="hard", oracle:str="algx") -> None :
+  """
+  Generate `count` puzzles of order `n` from fixed seeds with a budget of `node_budget` search nodes each, twice over.
+  The node budget stops the removals at the same point on every run, unlike a deadline, so both runs must give the same puzzles
+  """
+  gen_time = 0
+  distances = []
+  for seed in range(count) :
+    boards = []
+    for _ in range(2) :
+      random.seed(seed)
+      sudoku = Sudoku(n)
+      start = time.time()
+      distance = sudoku.generate_new_puzzle(difficulty, oracle=oracle, node_budget=node_budget)
+      gen_time += time.time() - start
+      assert sudoku.has_one_solution_algx()
+      boards.append(sudoku.board)
+    assert boards[0] == boards[1], "budgeted generation is not reproducible"
+    distances.append(distance)
+  print(f"n={n} generation with {node_budget} nodes: {gen_time/(2*count):.4f}s per puzzle, clues above the threshold {distances}")
+
+if __name__ == "__main__" :
+  orders = [int(arg) for arg in sys.argv[1:]] or [1, 2, 3, 4, 5]
+  for n in orders :
+    bench_backends(n)
+    bench_memory(n)
+    if n <= 3 :
+      bench_backtrack(n)
+      bench_strategies(n)
+    # An unbounded hard puzzle takes from ~4*n^4 (n=2) to ~27*n^4 (n=5) nodes, so this budget stops every order early.
+    # The 1x1 board is filled by propagation alone, no budget can stop it
+    if n >= 2 :
+      bench_generation(n, 2*n**4)
@@ -0,0 +1,78 @@
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from constants import EMPTY
+
+class Board :
+  # Cells of every unit (rows, then columns, then blocks), (unit, slot) pairs of every cell and peers of every cell, per order n
+  unit_tables:Dict[int, Tuple[List[List[int]], List[List[Tuple[int,int]]], List[List[int]]]] = {}
+
+  def __init__(self, n:int, cells:Optional[array]=None) -> None :
+    """
+    Sudoku board of order n, stored as one flat array of n^4 signed bytes with cell (r, c) at index r*n^2 + c.
+    Rows are memoryview slices of that array, so board[r][c] reads and writes the cell in place
+    """
+    self.n = n
+    self.cells = cells if cells is not None else array('b', [EMPTY]) * n**4
+    view = memoryview(self.cells)
+    self.rows = [view[r*n**2:(r+1)*n**2] for r in range(n**2)]
+    if n not in Board.unit_tables :
+      Board.unit_tables[n] = Board.build_unit_tables(n)
+    self.units, self.cell_units, self.peers = Board.unit_tables[n]
+
+  @staticmethod
+  def build_unit_tables(n:int) -> Tuple[List[List[int]], List[List[Tuple[int,int]]], List[List[int]]] :
+    """
+    Build the cells of every unit, the (unit, slot) pairs of every cell and the peers of every cell of a board of order n
+    """
+    units = (
+      [[r*n**2 + c for c in range(n**2)] for r in range(n**2)] +
+      [[r*n**2 + c for r in range(n**2)] for c in range(n**2)] +
+      [[(n*(b//n) + r)*n**2 + n*(b%n) + c for r in range(n) for c in range(n)] for b in range(n**2)]
+    )
+    cell_units = [[] for _ in range(n**4)]
+    for u, unit in enumerate(units) :
+      for slot, i in enumerate(unit) :
+        cell_units[i].append((u, slot))
+    peers = [sorted({j for u, _ in cell_units[i] for j in units[u]} - {i}) for i in range(n**4)]
+    return units, cell_units, peers
+
+  def __getitem__(self, row:int) -> memoryview :
+    return self.rows[row]
+
+  def __len__(self) -> int :
+    return len(self.rows)
+
+  def __iter__(self) -> Iterator[memoryview] :
+    return iter(self.rows)
+
+  def __eq__(self, other:object) -> bool :
+    return isinstance(other, Board) and self.cells == other.cells
+
+  def __repr__(self) -> str :
+    return repr(self.tolist())
+
+  def tolist(self) -> List[List[int]] :
+    """
+    Get the board as a list of row lists
+    """
+    return [row.tolist() for row in self.rows]
+
+  def copy(self) -> "Board" :
+    """
+    Get an independent copy of the board, a slice of the flat array
+    """
+    return Board(self.n, self.cells[:])
+
+  def __copy__(self) -> "Board" :
+    return self.copy()
+
+  def __deepcopy__(self, memo:dict) -> "Board" :
+    return self.copy()
+
+  # Memoryviews can't be pickled, only the order and the flat array are
+  def __getstate__(self) -> Tuple[int, array] :
+    return self.n, self.cells
+
+  def __setstate__(self, state:Tuple[int, array]) -> None :
+    self.__init__(*state)
@@ -0,0 +1,32 @@
+import time
+from typing import Optional
+
+class BudgetExhausted(Exception) :
+  """
+  Raised by a search that ran out of its SearchBudget, the search state is restored on the way out
+  """
+
+class SearchBudget :
+  def __init__(self, seconds:Optional[float]=None, nodes:Optional[int]=None) -> None :
+    """
+    Limit the work of the searches sharing this budget to `seconds` of wall clock time from now and/or `nodes` search nodes.
+    The node limit stops at the same point on every run, so it is the one to use for reproducible benchmarks.
+    The deadline is kept as wall clock time, so a copy of the budget sent to a worker process expires at the same time
+    """
+    self.deadline = time.time() + seconds if seconds is not None else None
+    self.max_nodes = nodes
+    self.n_nodes = 0
+
+  def is_exhausted(self) -> bool :
+    return (
+      (self.max_nodes is not None and self.n_nodes >= self.max_nodes) or
+      (self.deadline is not None and time.time() >= self.deadline)
+    )
+
+  def spend(self) -> None :
+    """
+    Count one search node, raising BudgetExhausted if the budget was already used up
+    """
+    if self.is_exhausted() :
+      raise BudgetExhausted
+    self.n_nodes += 1
@@ -1,112 +1,482 @@
-import copy
+import bisect
+import itertools
 import pprint
 import random
 import time
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from constants import EMPTY
 from sudoku import Sudoku
+from tracer import TRACE_OFF, TRACE_PROPAGATION, TRACE_SEARCH, Tracer
+
+def mask_bits(mask:int) -> List[int] :
+  """
+  Get the positions of all set bits of `mask`
+  """
+  bits = []
+  while mask :
+    low = mask & -mask
+    bits.append(low.bit_length()-1)
+    mask ^= low
+  return bits
+
+# Searches shared by the Algorithm X backends. A backend provides iter_solutions(randomize), a generator lazily yielding
+# the rows of every solution that restores the matrix once it is exhausted or closed
+class AlgXEngine :
+  def search(self) -> Optional[List] :
+    """
+    Returns the rows of the first solution Algorithm X finds to the exact cover matrix
+    """
+    solutions = self.iter_solutions(randomize=True)
+    solution = next(solutions, None)
+    solutions.close()
+    return solution
+
+  def count_solutions(self, limit:Optional[int]=None) -> int :
+    """
+    Count the solutions of the exact cover matrix, exploring the whole search tree
+    unless `limit` solutions are found first (e.g., limit=2 is enough to tell if a solution is unique)
+    """
+    n_solutions = 0
+    solutions = self.iter_solutions()
+    for _ in solutions :
+      n_solutions += 1
+      if n_solutions == limit :
+        break
+    solutions.close()
+    return n_solutions
+
+class AlgX(AlgXEngine) :
+  def __init__(self, ec_rows:List[Tuple[int, ...]], cols:int) -> None :
+    """
+    Initialize the Algorithm X solver with a given exact cover matrix.
+    The matrix is stored as Knuth's dancing links: every 1 of the matrix is a node that is
+    doubly linked to its horizontal and vertical neighbours, all kept in flat lists indexed by node
+
+    ec_rows: Sparse exact cover matrix, i.e. the columns holding a 1 for each row
+    cols: Number of columns of the exact cover matrix
+    """
+    self.rows, self.cols = len(ec_rows), cols
+    # Node 0 is the root, nodes 1..cols are the column headers (column j has header node j+1)
+    self.L = [self.cols] + list(range(self.cols))
+    self.R = list(range(1, self.cols+1)) + [0]
+    self.U = list(range(self.cols+1))
+    self.D = list(range(self.cols+1))
+    self.C = list(range(self.cols+1))   # Column header of each node
+    self.S = [0] * (self.cols+1)        # Number of live nodes of each column header
+    self.row_of = [-1] * (self.cols+1)  # Exact cover matrix row of each node
+    self.row_head = [-1] * self.rows    # First node of each exact cover matrix row
+    self.selected_rows = []             # Rows selected by `select_row`, in selection order
+    self.budget = None                  # SearchBudget charged one node per selected row, if any
+    for i, columns in enumerate(ec_rows) :
+      self.add_row(i, columns)
+    self.link_buckets()
+
+  def add_row(self, row_id:int, columns:Tuple[int, ...]) -> None :
+    """
+    Append the nodes of row `row_id`, which has its 1's on the given `columns`
+    """
+    L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+    first = -1
+    for j in columns :
+      node, col = len(C), j+1
+      # Link the node at the bottom of its column
+      U.append(U[col]); D.append(col)
+      D[U[col]] = node; U[col] = node
+      C.append(col); S[col] += 1
+      self.row_of.append(row_id)
+      # Link the node at the end of its row
+      if first == -1 :
+        first = node
+        L.append(node); R.append(node)
+      else :
+        L.append(L[first]); R.append(first)
+        R[L[first]] = node; L[first] = node
+    self.row_head[row_id] = first
+
+  def link_buckets(self) -> None :
+    """
+    Put every column header into the bucket of its size. Buckets are circular doubly linked lists
+    (`BN`/`BP`) whose head for size s is node `bucket_base+s`, so the live column with the fewest 1's
+    is found by walking the buckets upwards instead of scanning all the columns
+    """
+    S = self.S
+    max_size = max(S) if self.cols else 0
+    self.bucket_base = self.cols+1
+    self.BN = list(range(self.bucket_base + max_size+1))
+    self.BP = list(range(self.bucket_base + max_size+1))
+    for col in range(1, self.cols+1) :
+      self.bucket_insert(col, S[col])
+
+  def bucket_insert(self, col:int, size:int) -> None :
+    """
+    Insert the column header `col` right after the head of bucket `size`
+    """
+    BN, BP = self.BN, self.BP
+    head = self.bucket_base + size
+    BN[col] = BN[head]; BP[col] = head
+    BP[BN[head]] = col; BN[head] = col
+
+  def iter_solutions(self, randomize:bool=False) -> Iterator[List[int]] :
+    """
+    Implementation of Donald Knuth's Algorithm X using dancing links, on an explicit stack instead of recursion.
+    Lazily yields the rows of every solution of the exact cover matrix, trying the rows of each column
+    in random order if `randomize` is set. The matrix is restored once the generator is exhausted or closed
+    """
+    L, R, C, S = self.L, self.R, self.C, self.S
+    solution = []   # Selected node of each level
+    stack = []      # [column header, candidate nodes, index of the selected candidate] of each level
+    try :
+      while True :
+        if R[0] == 0 :
+          yield [self.row_of[node] for node in solution]
+        else :
+          # Select column with the fewest 1's, if it hasn't any 1 in it this branch terminates unsuccessfully
+          col = self.select_column()
+          if S[col] :
+            sln_candidates = self.get_rows_for_column(col)
+            if randomize :
+              random.shuffle(sln_candidates)
+            self.cover_column(col)
+            stack.append([col, sln_candidates, -1])
+        # Move to the next untried row of the deepest level, backtracking through the exhausted levels
+        while stack :
+          level = stack[-1]
+          col, sln_candidates, k = level
+          if k >= 0 :
+            # Uncover the columns in reverse order and deselect the previous row
+            node = solution.pop()
+            j = L[node]
+            while j != node :
+              self.uncover_column(C[j])
+              j = L[j]
+          k += 1
+          if k < len(sln_candidates) :
+            # Select this row and cover all the other columns that are satisfied by it
+            node = sln_candidates[k]
+            solution.append(node)
+            j = R[node]
+            while j != node :
+              self.cover_column(C[j])
+              j = R[j]
+            level[2] = k
+            # Charged once the row is selected, so the matrix is restored as usual if the budget runs out
+            if self.budget is not None :
+              self.budget.spend()
+            break
+          self.uncover_column(col)
+          stack.pop()
+        else :
+          return
+    finally :
+      while stack :
+        col, _, _ = stack.pop()
+        node = solution.pop()
+        j = L[node]
+        while j != node :
+          self.uncover_column(C[j])
+          j = L[j]
+        self.uncover_column(col)
 
-class AlgX :
-  def __init__(self, ec_mat:List[List[int]]) -> None :
+  def select_column(self) -> int :
     """
-    Initialize the Algorithm X solver with a given exact cover matrix
+    Select the header of the next column to cover (i.e., the live column with the fewest 1's)
+    """
+    BN, head = self.BN, self.bucket_base
+    for bucket in range(head, len(BN)) :
+      if BN[bucket] != bucket :
+        return BN[bucket]
+    return 0
 
-    ec_mat: List of lists representing the exact cover matrix
+  def get_rows_for_column(self, col:int) -> List :
     """
-    assert ec_mat[0] is not None
-    self.ec_mat = ec_mat
-    self.rows, self.cols = len(ec_mat), len(ec_mat[0])
+    Get the nodes of all live rows that satisfy the column constraint with header `col`
+    """
+    nodes = []
+    i = self.D[col]
+    while i != col :
+      nodes.append(i)
+      i = self.D[i]
+    return nodes
+
+  def select_row(self, row_id:int) -> bool :
+    """
+    Put row `row_id` into the partial solution by covering all of its columns.
+    Returns False (and leaves the matrix untouched) if one of its columns is already covered
+    """
+    L, R, C = self.L, self.R, self.C
+    first = self.row_head[row_id]
+    j = first
+    while True :
+      if R[L[C[j]]] != C[j] :
+        return False
+      j = R[j]
+      if j == first :
+        break
+    while True :
+      self.cover_column(C[j])
+      j = R[j]
+      if j == first :
+        break
+    self.selected_rows.append(row_id)
+    return True
 
-  def search(self, solution:dict={}, backup:List=[], k:int=0) -> Optional[List] :
+  def deselect_row(self, row_id:int) -> None :
+    """
+    Take row `row_id`, previously put by `select_row`, out of the partial solution.
+    Dancing links can only be undone in reverse order, so the rows selected after it are deselected and then selected again
+    """
+    L, C = self.L, self.C
+    k = self.selected_rows.index(row_id)
+    later_rows = self.selected_rows[k+1:]
+    for row in reversed(self.selected_rows[k:]) :
+      first = self.row_head[row]
+      j = L[first]
+      while True :
+        self.uncover_column(C[j])
+        if j == first :
+          break
+        j = L[j]
+    del self.selected_rows[k:]
+    for row in later_rows :
+      self.select_row(row)
+
+  def hide_row(self, row_id:int) -> None :
+    """
+    Unlink the live row `row_id` from its columns without selecting it, until `unhide_row` links it back
+    """
+    R, U, D, C, S, BN, BP = self.R, self.U, self.D, self.C, self.S, self.BN, self.BP
+    first = self.row_head[row_id]
+    j = first
+    while True :
+      D[U[j]] = D[j]
+      U[D[j]] = U[j]
+      c = C[j]
+      BN[BP[c]] = BN[c]
+      BP[BN[c]] = BP[c]
+      S[c] -= 1
+      self.bucket_insert(c, S[c])
+      j = R[j]
+      if j == first :
+        break
+
+  def unhide_row(self, row_id:int) -> None :
+    """
+    Link back the row `row_id` unlinked by `hide_row`
+    """
+    L, U, D, C, S, BN, BP = self.L, self.U, self.D, self.C, self.S, self.BN, self.BP
+    first = self.row_head[row_id]
+    j = L[first]
+    while True :
+      c = C[j]
+      BN[BP[c]] = BN[c]
+      BP[BN[c]] = BP[c]
+      S[c] += 1
+      self.bucket_insert(c, S[c])
+      D[U[j]] = j
+      U[D[j]] = j
+      if j == first :
+        break
+      j = L[j]
+
+  def cover_column(self, col:int) -> None :
+    """
+    Cover the column with header `col`: unlink it from the header list and its size bucket,
+    then unlink all of its rows from the other columns, moving those columns one bucket down
+    """
+    L, R, U, D, C, S, BN, BP = self.L, self.R, self.U, self.D, self.C, self.S, self.BN, self.BP
+    head = self.bucket_base
+    R[L[col]] = R[col]
+    L[R[col]] = L[col]
+    BN[BP[col]] = BN[col]
+    BP[BN[col]] = BP[col]
+    i = D[col]
+    while i != col :
+      j = R[i]
+      while j != i :
+        D[U[j]] = D[j]
+        U[D[j]] = U[j]
+        c = C[j]
+        BN[BP[c]] = BN[c]
+        BP[BN[c]] = BP[c]
+        S[c] -= 1
+        bucket = head + S[c]
+        BN[c] = BN[bucket]; BP[c] = bucket
+        BP[BN[bucket]] = c; BN[bucket] = c
+        j = R[j]
+      i = D[i]
+
+  def uncover_column(self, col:int) -> None :
+    """
+    Uncover the column with header `col`, relinking everything `cover_column` removed in the exact reverse order
+    """
+    L, R, U, D, C, S, BN, BP = self.L, self.R, self.U, self.D, self.C, self.S, self.BN, self.BP
+    head = self.bucket_base + 1
+    i = U[col]
+    while i != col :
+      j = L[i]
+      while j != i :
+        c = C[j]
+        BN[BP[c]] = BN[c]
+        BP[BN[c]] = BP[c]
+        bucket = head + S[c]
+        BN[c] = BN[bucket]; BP[c] = bucket
+        BP[BN[bucket]] = c; BN[bucket] = c
+        S[c] += 1
+        D[U[j]] = j
+        U[D[j]] = j
+        j = L[j]
+      i = U[i]
+    self.bucket_insert(col, S[col])
+    R[L[col]] = col
+    L[R[col]] = col
+
+class BitsetAlgX(AlgXEngine) :
+  def __init__(self, ec_rows:List[Tuple[int, ...]], cols:int) -> None :
+    """
+    Initialize the Algorithm X solver with a given exact cover matrix.
+    Every row and every column is stored as a Python int bitmask, so covering, conflict detection
+    and counting the live rows of a column are plain AND/OR/popcount operations
+
+    ec_rows: Sparse exact cover matrix, i.e. the columns holding a 1 for each row
+    cols: Number of columns of the exact cover matrix
+    """
+    self.rows, self.cols = len(ec_rows), cols
+    self.row_masks = [0] * self.rows  # Bit j of row_masks[i] is set if row i has a 1 in column j
+    self.col_masks = [0] * self.cols  # Bit i of col_masks[j] is set if row i has a 1 in column j
+    for i, columns in enumerate(ec_rows) :
+      for j in columns :
+        self.row_masks[i] |= 1 << j
+        self.col_masks[j] |= 1 << i
+    # Rows sharing at least one column with row i (row i included), i.e. the rows removed by selecting it
+    self.row_conflicts = [0] * self.rows
+    for i in range(self.rows) :
+      for j in mask_bits(self.row_masks[i]) :
+        self.row_conflicts[i] |= self.col_masks[j]
+    self.live_rows = (1 << self.rows) - 1
+    self.live_cols = (1 << self.cols) - 1
+    self.budget = None  # SearchBudget charged one node per selected row, if any
+
+  def iter_solutions(self, randomize:bool=False) -> Iterator[List[int]] :
+    """
+    Implementation of Donald Knuth's Algorithm X on bitmasks, on an explicit stack instead of recursion.
+    Lazily yields the rows of every solution of the exact cover matrix, trying the rows of each column
+    in random order if `randomize` is set. The masks are restored once the generator is exhausted or closed
+    """
+    row_masks, row_conflicts = self.row_masks, self.row_conflicts
+    solution = []   # Selected row of each level
+    stack = []      # [live rows, live columns, candidate rows, index of the selected candidate] before each level
+    try :
+      while True :
+        if not self.live_cols :
+          yield list(solution)
+        else :
+          # Select column with the fewest 1's, if it hasn't any 1 in it this branch terminates unsuccessfully
+          sln_candidates = self.get_rows_for_column(self.select_column())
+          if sln_candidates :
+            if randomize :
+              random.shuffle(sln_candidates)
+            stack.append([self.live_rows, self.live_cols, sln_candidates, -1])
+        # Move to the next untried row of the deepest level, backtracking through the exhausted levels
+        while stack :
+          level = stack[-1]
+          live_rows, live_cols, sln_candidates, k = level
+          if k >= 0 :
+            solution.pop()
+          k += 1
+          if k < len(sln_candidates) :
+            # Select this row: its columns are satisfied and every row sharing one of them is removed
+            row_id = sln_candidates[k]
+            solution.append(row_id)
+            self.live_cols = live_cols & ~row_masks[row_id]
+            self.live_rows = live_rows & ~row_conflicts[row_id]
+            level[3] = k
+            if self.budget is not None :
+              self.budget.spend()
+            break
+          # Restoring the two masks undoes every cover made below this level
+          self.live_rows, self.live_cols = live_rows, live_cols
+          stack.pop()
+        else :
+          return
+    finally :
+      if stack :
+        self.live_rows, self.live_cols = stack[0][0], stack[0][1]
+
+  def select_column(self) -> int :
     """
-    Implementation of Donald Knuth's Algorithm X.
-    Returns the first solution it finds to the exact cover matrix
+    Select the next column to cover (i.e., the live column with the fewest live rows)
     """
-    if all(row is None for row in self.ec_mat) :
-      if sum(n_constraints for _, n_constraints in solution.items()) == self.cols :
-        return list(solution.keys())
-      return None
+    live_rows, col_masks = self.live_rows, self.col_masks
+    best, best_size = -1, self.rows+1
+    cols = self.live_cols
+    while cols and best_size > 1 :
+      low = cols & -cols
+      col = low.bit_length()-1
+      size = (col_masks[col] & live_rows).bit_count()
+      if size < best_size :
+        best, best_size = col, size
+      cols ^= low
+    return best
 
-    # Select column with the fewest 1's
-    col = self.select_column()
-    # If the column with the "fewest" 1's hasn't any 1 in it, algorithm terminates unsuccessfully
-    if sum(row[col] for row in self.ec_mat if row is not None) == 0 :
-      return None
+  def get_rows_for_column(self, col:int) -> List :
+    """
+    Get all live rows that satisfy the given column constraint `col`
+    """
+    return mask_bits(self.col_masks[col] & self.live_rows)
 
-    sln_candidates = self.get_rows_for_column(col)
-    random.shuffle(sln_candidates)
-
-    for sln_cand in sln_candidates :
-      # Select this row
-      solution[sln_cand] = self.ec_mat[sln_cand].count(1)
-      satisfied_columns = [j for j in range(len(self.ec_mat[sln_cand])) if self.ec_mat[sln_cand][j] == 1]
-      # Cover all columns that are satisfied by this row
-      for satisfied_column in satisfied_columns :
-        self.cover_column(satisfied_column, backup)
-      # Recurse and search deeper
-      result = self.search(solution, backup, k+1)
-      if result is not None :
-        return result
-      # Uncover all columns if this row didn't lead to a solution
-      for _ in range(len(satisfied_columns)) :
-        self.uncover_column(backup)
-      # Deselect this row 
-      del solution[sln_cand]
-    return None
+  def select_row(self, row_id:int) -> bool :
+    """
+    Put row `row_id` into the partial solution by covering all of its columns.
+    Returns False (and leaves the matrix untouched) if one of its columns is already covered
+    """
+    if self.row_masks[row_id] & ~self.live_cols :
+      return False
+    self.live_cols &= ~self.row_masks[row_id]
+    self.live_rows &= ~self.row_conflicts[row_id]
+    return True
 
-  def select_column(self) -> int :
+  def deselect_row(self, row_id:int) -> None :
     """
-    Select the next column to cover (e.g., column with the fewest 1's)
+    Take row `row_id`, previously put by `select_row`, out of the partial solution
     """
-    return min(
-      [j for j in range(self.cols) if all(isinstance(row[j], int) for row in self.ec_mat if row is not None)],
-      key=lambda col: sum(row[col] for row in self.ec_mat if row is not None)
-    )
+    self.live_cols |= self.row_masks[row_id]
+    # A row removed by this one comes back unless one of its columns is still covered by another selected row
+    for row in mask_bits(self.row_conflicts[row_id]) :
+      if not self.row_masks[row] & ~self.live_cols :
+        self.live_rows |= 1 << row
 
-  def get_rows_for_column(self, col:int) -> List :
+  def hide_row(self, row_id:int) -> None :
     """
-    Get all rows that satisfy the given column constraint `col`
+    Remove the live row `row_id` without selecting it, until `unhide_row` puts it back
     """
-    # Return all rows that have a '1' in the given column
-    return [i for i in range(self.rows) if self.ec_mat[i] is not None and self.ec_mat[i][col] == 1]
+    self.live_rows &= ~(1 << row_id)
 
-  def cover_column(self, col:int, backup:List=[]) -> None :
+  def unhide_row(self, row_id:int) -> None :
     """
-    Cover column `col` and save the column index `col` and all the removed rows in the `backup` list
+    Put back the row `row_id` removed by `hide_row`
     """
-    removed_rows = []
-    # Mark removed rows as `None` and store them in the `backup` list
-    for i in range(self.rows) :
-      if self.ec_mat[i] is not None and self.ec_mat[i][col] == 1 :
-        removed_rows.append((i, self.ec_mat[i]))  # Store tuple (row index, row contents)
-        self.ec_mat[i] = None # Remove row by setting it to `None`
-    # Remove the column from the remaining rows
-    for row in self.ec_mat :
-      if row is not None :
-        row[col] = str(row[col])
-    # Store the covered column index and removed rows in the `backup` list
-    backup.append((col, removed_rows))
-
-  def uncover_column(self, backup:List) -> None :
-    """
-    Uncover columns and restore removed rows using columns removal history list `backup`
-    """
-    # Get the most recently removed rows for this column
-    col, removed_rows = backup.pop()
-    # Restore the column values in all non-removed rows
-    for row in self.ec_mat :
-      if row is not None :
-        if isinstance(row[col], str) :
-          row[col] = int(row[col])
-    # Restore the removed rows
-    for i, row_content in removed_rows :
-      self.ec_mat[i] = row_content
-
-class AlgXSudokuSolver(AlgX) :
-  def __init__(self, sudoku:Sudoku) -> None :
-    super().__init__(self.sudoku_as_ec_mat(sudoku))
-    self.sudoku = copy.deepcopy(sudoku)
+    self.live_rows |= 1 << row_id
+
+ALGX_BACKENDS = {
+  "dlx": AlgX,
+  "bitset": BitsetAlgX
+}
+
+class AlgXSudokuSolver :
+  # Sparse exact cover matrix of each order, built once per process and shared read-only
+  ec_mats:Dict[int, List[Tuple[int, int, int, int]]] = {}
+
+  def __init__(self, sudoku:Sudoku, backend:str="dlx") -> None :
+    assert backend in ALGX_BACKENDS
+    self.n = sudoku.n
+    # The givens are only read while pruning the matrix, so the sudoku is not copied
+    self.sudoku = sudoku
+    self.algx = None
+    pruned_ec_mat = self.prune_ec_mat()
+    if pruned_ec_mat is not None :
+      ec_rows, cols, self.row_ids = pruned_ec_mat
+      self.algx = ALGX_BACKENDS[backend](ec_rows, cols)
 
   def solve(self) -> Optional[dict] :
     """
@@ -114,257 +484,519 @@ class AlgXSudokuSolver(AlgX) :
 
     sudoku: A sudoku object
     """
-    N_CANDIDATES = self.sudoku.n*self.sudoku.n
+    # Two givens satisfying the same constraint means there is no solution
+    if self.algx is None :
+      return None
+    solution = self.algx.search()
+    if solution is None :
+      return None
+    return self.decode_solution(solution)
+
+  def iter_solutions(self) -> Iterator[dict] :
+    """
+    Lazily yield every solution of the given Sudoku board, one at a time.
+    Only the current search path is kept in memory, so the caller can stream the solutions or stop whenever it likes
+    """
+    if self.algx is None :
+      return
+    solutions = self.algx.iter_solutions()
+    try :
+      for solution in solutions :
+        yield self.decode_solution(solution)
+    finally :
+      solutions.close()
+
+  def decode_solution(self, solution:List[int]) -> dict :
+    """
+    Convert the rows of an exact cover solution to the numbers they put on the empty cells
+    """
+    N_CANDIDATES = self.n*self.n
     N_CELLS = N_CANDIDATES*N_CANDIDATES
-    solution = {}
-    for r in range(N_CANDIDATES) :
-      for c in range(N_CANDIDATES) :
-        if not self.sudoku.is_cell_empty(self.sudoku.board, r, c) :
-          num = self.sudoku.board[r][c]
-          row_id = r*N_CELLS + c*N_CANDIDATES + num
-          solution[row_id] = self.ec_mat[row_id].count(1)
-          column_ids = [j for j in range(len(self.ec_mat[row_id])) if self.ec_mat[row_id][j] == 1]
-          for column_id in column_ids :
-            self.cover_column(column_id)
     return {
-      (row_id//81, (row_id%81)//9): row_id%9
-      for row_id in self.search(solution.copy())
-      if row_id not in solution
+      (row_id//N_CELLS, (row_id%N_CELLS)//N_CANDIDATES): row_id%N_CANDIDATES
+      for row_id in (self.row_ids[i] for i in solution)
     }
 
-  def sudoku_as_ec_mat(self, sudoku:Sudoku) -> List[List[int]] :
-    """
-    Convert a given sudoku object to exact cover matrix
+  def count_solutions(self, limit:Optional[int]=None) -> int :
+    """
+    Count the solutions of the given Sudoku board, stopping as soon as `limit` solutions are found
+    """
+    if self.algx is None :
+      return 0
+    return self.algx.count_solutions(limit)
+
+  def has_other_solution(self, removed_cell_to_num:dict) -> bool :
+    """
+    Sudoku.has_other_solution on the matrix, hiding the row of a removed number instead of forbidding it
+    """
+    if self.algx is None :
+      return False
+    N_CANDIDATES = self.n*self.n
+    has_other = False
+    selected_rows = []
+    # The matrix is restored even if the engine's budget runs out during a search
+    try :
+      for (r, c), num in removed_cell_to_num.items() :
+        # The original row ids are sorted, so the engine row is found by bisection (the identity for a whole matrix)
+        row = bisect.bisect_left(self.row_ids, r*N_CANDIDATES*N_CANDIDATES + c*N_CANDIDATES + num)
+        self.algx.hide_row(row)
+        try :
+          has_other = self.algx.count_solutions(limit=1) > 0
+        finally :
+          self.algx.unhide_row(row)
+        if has_other :
+          break
+        self.algx.select_row(row)
+        selected_rows.append(row)
+    finally :
+      for row in reversed(selected_rows) :
+        self.algx.deselect_row(row)
+    return has_other
+
+  @classmethod
+  def get_ec_mat(cls, n:int) -> List[Tuple[int, int, int, int]] :
+    """
+    Get the exact cover matrix of order n, building it on first use
+    """
+    if n not in cls.ec_mats :
+      cls.ec_mats[n] = cls.sudoku_as_ec_mat(n)
+    return cls.ec_mats[n]
+
+  def prune_ec_mat(self) -> Optional[Tuple[List[Tuple[int, ...]], int, List[int]]] :
+    """
+    Build the exact cover matrix that is left once the givens are placed: the columns they satisfy are dropped
+    and only the rows of empty cells that clash with no given are kept, with their columns renumbered.
+    Returns the pruned rows, the number of columns left and the original row id of every pruned row,
+    or None if two givens satisfy the same constraint
+    """
+    n = self.sudoku.n
+    N_CANDIDATES = n*n
+    N_CELLS = N_CANDIDATES*N_CANDIDATES
+    ec_rows = self.get_ec_mat(n)
+    board = self.sudoku.board
+
+    satisfied = [False] * (4*N_CELLS)
+    for r, c in self.sudoku.get_non_empty_cells(board) :
+      for j in ec_rows[r*N_CELLS + c*N_CANDIDATES + board[r][c]] :
+        if satisfied[j] :
+          return None
+        satisfied[j] = True
+    col_index = [-1] * (4*N_CELLS)
+    cols = 0
+    for j in range(4*N_CELLS) :
+      if not satisfied[j] :
+        col_index[j] = cols
+        cols += 1
+
+    pruned_rows, row_ids = [], []
+    for r, c in self.sudoku.get_empty_cells(board) :
+      for row_id in range(r*N_CELLS + c*N_CANDIDATES, r*N_CELLS + (c+1)*N_CANDIDATES) :
+        columns = ec_rows[row_id]
+        if satisfied[columns[1]] or satisfied[columns[2]] or satisfied[columns[3]] :
+          continue
+        pruned_rows.append(tuple(col_index[j] for j in columns))
+        row_ids.append(row_id)
+    return pruned_rows, cols, row_ids
+
+  @staticmethod
+  def sudoku_as_ec_mat(n:int) -> List[Tuple[int, int, int, int]] :
+    """
+    Get the sparse exact cover matrix of a sudoku of order `n`.
+    Row r*N_CELLS + c*N_CANDIDATES + num places digit `num` on cell (r,c) and holds the columns of its 4 constraints
     """
-    n = sudoku.n
     N_CANDIDATES = n*n
     N_CELLS = N_CANDIDATES*N_CANDIDATES
-    ec_mat = []
 
-    # Generate exact cover matrix for the given sudoku object
     # There are 4 constraints: row-column, row-number, column-number, and block-number
-    for r in range(N_CANDIDATES) :
-      for c in range(N_CANDIDATES) :
-        for num in range(N_CANDIDATES) :
-          row = [0] * (4*N_CELLS)
-
-          # Row-column constraint (there is one number in each cell)
-          row[0*N_CELLS + r*N_CANDIDATES + c] = 1
-
-          # Row-number constraint (digit `num` appears in row r)
-          row[1*N_CELLS + r*N_CANDIDATES + num] = 1
-
-          # Column-number constraint (digit `num` appears in column c)
-          row[2*N_CELLS + c*N_CANDIDATES + num] = 1
-
-          # Block constraint (digit `num` appears in the n*n sub-block)
-          block_offset = N_CANDIDATES * (n*(r//n) + c//n)
-          row[3*N_CELLS + block_offset + num] = 1
-
-          # Add the row to the exact cover matrix
-          ec_mat.append(row)
+    ec_rows = [
+      (
+        0*N_CELLS + r*N_CANDIDATES + c,                             # Row-column constraint (there is one number in each cell)
+        1*N_CELLS + r*N_CANDIDATES + num,                           # Row-number constraint (digit `num` appears in row r)
+        2*N_CELLS + c*N_CANDIDATES + num,                           # Column-number constraint (digit `num` appears in column c)
+        3*N_CELLS + N_CANDIDATES*(n*(r//n) + c//n) + num            # Block constraint (digit `num` appears in the n*n sub-block)
+      )
+      for r in range(N_CANDIDATES)
+      for c in range(N_CANDIDATES)
+      for num in range(N_CANDIDATES)
+    ]
 
-    # Do exact cover matrix checking using the given sudoku board
-    self.check_ec_mat(ec_mat, sudoku)
-    return ec_mat
+    # Do exact cover matrix checking once for this order
+    AlgXSudokuSolver.check_ec_mat(ec_rows, n)
+    return ec_rows
 
-  def check_ec_mat(self, ec_mat:List[List[int]], sudoku:Sudoku) -> None :
+  @staticmethod
+  def check_ec_mat(ec_rows:List[Tuple[int, int, int, int]], n:int) -> None :
     """
-    Perform assertions to check the correctness of the exact cover matrix (ec_mat)
+    Perform assertions to check the correctness of the sparse exact cover matrix (ec_rows)
     """
-    n = sudoku.n
     N_CANDIDATES = n*n
     N_CELLS = N_CANDIDATES*N_CANDIDATES
 
     # 1. Check the overall dimensions of the matrix
-    assert len(ec_mat) == N_CELLS*N_CANDIDATES, f"Matrix should have {N_CELLS*N_CANDIDATES} rows, but got {len(ec_mat)}"
-    assert all(len(row) == 4*N_CELLS for row in ec_mat), f"Each row should have {4*N_CELLS} columns"
+    assert len(ec_rows) == N_CELLS*N_CANDIDATES, f"Matrix should have {N_CELLS*N_CANDIDATES} rows, but got {len(ec_rows)}"
 
-    # 2. Check each row has exactly 4 ones (one for each constraint)
-    for i, row in enumerate(ec_mat):
-      assert sum(row) == 4, f"Row {i} should have exactly 4 ones, but got {sum(row)}"
+    # 2. Check each row has exactly 4 ones, one in each constraint's block of columns
+    for i, columns in enumerate(ec_rows) :
+      assert len(columns) == 4, f"Row {i} should have exactly 4 ones, but got {len(columns)}"
+      assert all(k*N_CELLS <= j < (k+1)*N_CELLS for k, j in enumerate(columns)), f"Row {i} has its ones in the wrong constraints"
 
-    # 3. Check specific constraints (e.g., using number placements on the given sudoku board)
-    for r, c in sudoku.get_non_empty_cells(sudoku.board) :
-      num = sudoku.board[r][c]
-      row = ec_mat[r*N_CELLS + c*N_CANDIDATES + num]
-      # Cell constraint: one number per cell
-      assert row[0*N_CELLS + r*N_CANDIDATES + c] == 1, f"Cell constraint failed for ({r},{c})"
-      # Row constraint: one occurrence of each digit in each row
-      assert row[1*N_CELLS + r*N_CANDIDATES + num] == 1, f"Row constraint failed for row {r}"
-      # Column constraint: one occurrence of each digit in each column
-      assert row[2*N_CELLS + c*N_CANDIDATES + num] == 1, f"Column constraint failed for column {c}"
-      # Block constraint: one occurrence of each digit in each block
-      block_offset = N_CANDIDATES * (n*(r//n) + (c//n))
-      assert row[3*N_CELLS + block_offset + num] == 1, f"Block constraint failed for block ({r//n},{c//n})"
+    # 3. Check specific constraints of every number placement
+    for r in range(N_CANDIDATES) :
+      for c in range(N_CANDIDATES) :
+        for num in range(N_CANDIDATES) :
+          columns = ec_rows[r*N_CELLS + c*N_CANDIDATES + num]
+          # Cell constraint: one number per cell
+          assert columns[0] == 0*N_CELLS + r*N_CANDIDATES + c, f"Cell constraint failed for ({r},{c})"
+          # Row constraint: one occurrence of each digit in each row
+          assert columns[1] == 1*N_CELLS + r*N_CANDIDATES + num, f"Row constraint failed for row {r}"
+          # Column constraint: one occurrence of each digit in each column
+          assert columns[2] == 2*N_CELLS + c*N_CANDIDATES + num, f"Column constraint failed for column {c}"
+          # Block constraint: one occurrence of each digit in each block
+          block_offset = N_CANDIDATES * (n*(r//n) + (c//n))
+          assert columns[3] == 3*N_CELLS + block_offset + num, f"Block constraint failed for block ({r//n},{c//n})"
     return
 
-class BacktrackSudokuSolver :
-  def __init__(self, sudoku:Sudoku) -> None:
-    self.sudoku = copy.deepcopy(sudoku)
+class AlgXSudokuSession(AlgXSudokuSolver) :
+  def __init__(self, sudoku:Sudoku, backend:str="bitset") -> None :
+    """
+    Keep the exact cover matrix of the whole order alive across queries, starting with the givens of `sudoku` selected.
+    Givens are then added and removed incrementally, so each query only pays for its own search.
+    The bitset backend is the default since it removes any given in place, while dancing links have to replay later givens
+    """
+    assert backend in ALGX_BACKENDS
+    self.n = sudoku.n
+    self.sudoku = sudoku
+    N_CANDIDATES = self.n*self.n
+    N_CELLS = N_CANDIDATES*N_CANDIDATES
+    self.algx = ALGX_BACKENDS[backend](self.get_ec_mat(self.n), 4*N_CELLS)
+    self.row_ids = range(N_CELLS*N_CANDIDATES)
+    self.givens = {}
+    for r, c in sudoku.get_non_empty_cells(sudoku.board) :
+      assert self.add_given(r, c, sudoku.board[r][c]), f"Given {sudoku.board[r][c]} on ({r},{c}) clashes with another given"
 
-  def solve(self, solution:dict={}, k:int=0) -> Optional[dict] :
+  def add_given(self, r:int, c:int, num:int) -> bool :
+    """
+    Put number `num` on the empty cell (r,c).
+    Returns False (and changes nothing) if it clashes with one of the current givens
     """
-    Solve the given unsolved Sudoku board using backtrack algorithm
+    N_CANDIDATES = self.n*self.n
+    assert (r, c) not in self.givens
+    if not self.algx.select_row(r*N_CANDIDATES*N_CANDIDATES + c*N_CANDIDATES + num) :
+      return False
+    self.givens[(r, c)] = num
+    return True
 
-    sudoku: A sudoku object
+  def remove_given(self, r:int, c:int) -> None :
     """
-    obv_cells = []
-    if not (self.solve_obvious_cells(obv_cells) and
-            self.solve_obvious_rows(obv_cells) and
-            self.solve_obvious_cols(obv_cells) and
-            self.solve_obvious_blocks(obv_cells)) :
-      return None
-    # print(f"\t"*k, k, "cells updated:", obv_cells, len(obv_cells))
-    for r, c in obv_cells :
-      solution[(r, c)] = self.sudoku.board[r][c]
-
-    if self.is_board_full() :
-      # print(f"\t"*k, k, "SIGMA SIGMA SIGMA")
-      return solution
-    else :
-      empty_cells = sorted(
-        self.sudoku.get_empty_cells(self.sudoku.board),
-        key=lambda cell: len(self.sudoku.get_num_candidates(self.sudoku.board, cell[0], cell[1]))
-      )
-      num_candidates = self.sudoku.get_num_candidates(self.sudoku.board, empty_cells[0][0], empty_cells[0][1])
-      for num_candidate in num_candidates :
-        # print(f"\t"*k, k, "searching", empty_cells[0], num_candidates, num_candidate)
-        solution[(empty_cells[0][0], empty_cells[0][1])] = num_candidate
-        self.sudoku.board[empty_cells[0][0]][empty_cells[0][1]] = num_candidate
-        result = self.solve(solution, k+1)
-        if result is not None :
-          return result
-        else :
-          self.sudoku.board[empty_cells[0][0]][empty_cells[0][1]] = EMPTY
-          del solution[(empty_cells[0][0], empty_cells[0][1])]
-      self.unsolve_obvious(obv_cells)
-      return None
+    Empty the given cell (r,c)
+    """
+    N_CANDIDATES = self.n*self.n
+    num = self.givens.pop((r, c))
+    self.algx.deselect_row(r*N_CANDIDATES*N_CANDIDATES + c*N_CANDIDATES + num)
 
-  def solve_obvious_cells(self, obv_cells:List=[]) -> bool :
+  def has_one_solution(self) -> bool :
     """
-    Solve cells with only one possible candidate based on the current board state
+    Check if the current givens have exactly one solution
     """
-    if not self.is_board_full() :
-      empty_cells = self.sudoku.get_empty_cells(self.sudoku.board)
-      for r, c in empty_cells :
-        num_candidates = self.sudoku.get_num_candidates(self.sudoku.board, r, c)
-        if len(num_candidates) == 0 :
-          print("ohno!", "cell", (r,c), "have no cand")
-          self.unsolve_obvious(obv_cells)
+    return self.algx.count_solutions(limit=2) == 1
+
+class BacktrackSudokuSolver :
+  def __init__(self, sudoku:Sudoku, strategies:Tuple[str, ...]=(), tracer:Optional[Tracer]=None, randomize:bool=False) -> None:
+    # The search fills its own board, the given cells are slice-copied into the fresh sudoku's one
+    self.sudoku = Sudoku(sudoku.n)
+    self.sudoku.board.cells[:] = sudoku.board.cells
+    n, board = self.sudoku.n, self.sudoku.board
+    assert all(name in BACKTRACK_STRATEGIES for name in strategies), "unknown strategy"
+    # Elimination strategies run after every propagation, in the given order
+    self.strategy_names = tuple(strategies)
+    self.strategies = [BACKTRACK_STRATEGIES[name] for name in strategies]
+    # Hot paths only compare the trace level, so a solver without tracer pays nothing more
+    self.tracer = tracer
+    self.trace_level = tracer.level if tracer is not None else TRACE_OFF
+    # Number of candidates tried by the search
+    self.n_nodes = 0
+    self.cells = board.cells
+    self.units, self.cell_units, self.peers = board.units, board.cell_units, board.peers
+    self.all_nums = (1 << n**2) - 1
+    # Candidates mask of every cell, and mask of the slots of every unit where a number is still a candidate
+    self.candidates = [self.all_nums] * n**4
+    self.positions = [(1 << n**2) - 1] * (3*n**2 * n**2)
+    # Undo log of (cell, previous candidates mask) entries, where a negative mask stands for a placed number
+    self.trail = []
+    # Forced (cell, number) placements waiting to be made
+    self.queue = []
+    self.empty_cells = self.sudoku.get_empty_cells(board)
+    # A randomized search breaks the ties between the cells with the fewest candidates and tries candidates at random
+    self.randomize = randomize
+    if randomize :
+      random.shuffle(self.empty_cells)
+    self.n_empty_cells = n**4
+    self.is_consistent = all(
+      num == EMPTY or self.candidates[i] >> num & 1 and self.assign(i, num)
+      for i, num in enumerate(board.cells[:])
+    ) and self.reduce()
+    self.queue.clear()
+
+  def assign(self, i:int, num:int) -> bool :
+    """
+    Put `num` on the empty cell i and remove it from the candidates of its peers.
+    Return False if it leaves a cell or a unit without candidates
+    """
+    self.cells[i] = num
+    self.trail.append((i, -1))
+    self.n_empty_cells -= 1
+    if not self.eliminate(i, self.all_nums & ~(1 << num)) :
+      return False
+    for j in self.peers[i] :
+      if self.candidates[j] >> num & 1 and not self.eliminate(j, 1 << num) :
+        return False
+    return True
+
+  def eliminate(self, i:int, nums:int) -> bool :
+    """
+    Remove the numbers of mask `nums` from the candidates of cell i, queueing the naked and hidden singles it leaves behind.
+    Return False if it leaves a cell or a unit without candidates
+    """
+    old_mask = self.candidates[i]
+    nums &= old_mask
+    if nums == 0 :
+      return True
+    self.trail.append((i, old_mask))
+    mask = self.candidates[i] = old_mask & ~nums
+    if mask == 0 :
+      if self.trace_level >= TRACE_PROPAGATION :
+        self.tracer.emit("contradiction", cell=divmod(i, len(self.sudoku.board)), reason="no candidate left")
+      return False
+    if mask & (mask-1) == 0 :
+      self.queue.append((i, mask.bit_length()-1))
+    N = len(self.sudoku.board)
+    for u, slot in self.cell_units[i] :
+      unslot = ~(1 << slot)
+      removed = nums
+      while removed :
+        num = (removed & -removed).bit_length() - 1
+        removed &= removed - 1
+        slots = self.positions[u*N + num] = self.positions[u*N + num] & unslot
+        if slots == 0 :
+          if self.trace_level >= TRACE_PROPAGATION :
+            self.tracer.emit("contradiction", unit=u, num=num, reason="no position left")
           return False
-        elif len(num_candidates) == 1 :
-          self.sudoku.board[r][c] = num_candidates[0]
-          obv_cells.append((r, c))
-          print("obv_cell", (r,c), num_candidates, obv_cells)
+        if slots & (slots-1) == 0 :
+          self.queue.append((self.units[u][slots.bit_length()-1], num))
+    return True
+
+  def propagate(self) -> bool :
+    """
+    Make the queued forced placements, and the ones they force in turn, until the queue runs dry.
+    Return False on a contradiction, clearing the queue
+    """
+    cells = self.cells
+    while self.queue :
+      i, num = self.queue.pop()
+      if cells[i] == num :
+        continue
+      if cells[i] != EMPTY or not self.candidates[i] >> num & 1 :
+        if self.trace_level >= TRACE_PROPAGATION :
+          self.tracer.emit("contradiction", cell=divmod(i, len(self.sudoku.board)), num=num, reason="forced number not a candidate")
+        self.queue.clear()
+        return False
+      if self.trace_level >= TRACE_PROPAGATION :
+        self.tracer.emit("force", cell=divmod(i, len(self.sudoku.board)), num=num)
+      if not self.assign(i, num) :
+        self.queue.clear()
+        return False
+    return True
+
+  def reduce(self) -> bool :
+    """
+    Propagate the queued placements, then run the enabled strategies until none of them removes a candidate anymore.
+    Return False on a contradiction, clearing the queue
+    """
+    if not self.propagate() :
+      return False
+    k = 0
+    while k < len(self.strategies) :
+      mark = len(self.trail)
+      if not self.strategies[k](self) or not self.propagate() :
+        self.queue.clear()
+        return False
+      # Singles come first again once a strategy made progress
+      if len(self.trail) > mark :
+        if self.trace_level >= TRACE_PROPAGATION :
+          self.tracer.emit("strategy", name=self.strategy_names[k], changes=len(self.trail)-mark)
+        k = 0
+      else :
+        k += 1
     return True
 
-  def solve_obvious_rows(self, obv_cells:List=[]) -> bool :
+  def apply_naked_subsets(self, size:int) -> bool :
     """
-    Fill numbers in rows where a digit has only one valid position
+    Naked subsets: when `size` cells of a unit have only `size` candidates between them,
+    remove those candidates from the other cells of the unit
     """
-    if not self.is_board_full() :
-      for r in range(self.sudoku.n**2) :
-        for num in range(self.sudoku.n**2) :
-          is_num_exist_in_row = False
-          is_cell_safe = lambda r,c,num : self.sudoku.is_cell_empty(self.sudoku.board, r, c) and self.sudoku.is_num_valid(self.sudoku.board, r, c, num)
-          cell_candidates = []
-          for c in range(self.sudoku.n**2) :
-            if self.sudoku.board[r][c] == num :
-              is_num_exist_in_row = True
-              break
-            elif is_cell_safe(r, c, num) :
-              cell_candidates.append((r, c))
-          if not is_num_exist_in_row :
-            if len(cell_candidates) == 0 :
-              print("ohno!", "row", r, "can't put", num)
-              self.unsolve_obvious(obv_cells)
+    for unit in self.units :
+      cells = [i for i in unit if 2 <= self.candidates[i].bit_count() <= size]
+      for subset in itertools.combinations(cells, size) :
+        nums = 0
+        for i in subset :
+          nums |= self.candidates[i]
+        if nums.bit_count() == size :
+          for j in unit :
+            if j not in subset and self.candidates[j] & nums and not self.eliminate(j, nums) :
               return False
-            elif len(cell_candidates) == 1 :
-              self.sudoku.board[cell_candidates[0][0]][cell_candidates[0][1]] = num
-              obv_cells.append((cell_candidates[0][0], cell_candidates[0][1]))
-              print("obv_row", cell_candidates, num, obv_cells)
     return True
 
-  def solve_obvious_cols(self, obv_cells:List=[]) -> bool :
-    """
-    Fill numbers in columns where a digit has only one valid position
-    """
-    if not self.is_board_full() :
-      for c in range(self.sudoku.n**2) :
-        for num in range(self.sudoku.n**2) :
-          is_num_exist_in_col = False
-          is_cell_safe = lambda r,c,num : self.sudoku.is_cell_empty(self.sudoku.board, r, c) and self.sudoku.is_num_valid(self.sudoku.board, r, c, num)
-          cell_candidates = []
-          for r in range(self.sudoku.n**2) :
-            if self.sudoku.board[r][c] == num :
-              is_num_exist_in_col = True
-              break
-            elif is_cell_safe(r, c, num) :
-              cell_candidates.append((r, c))
-          if not is_num_exist_in_col :
-            if len(cell_candidates) == 0 :
-              pprint.pprint(self.sudoku.board)
-              print("ohno!", "col", c, "can't put", num)
-              self.unsolve_obvious(obv_cells)
+  def apply_hidden_subsets(self, size:int) -> bool :
+    """
+    Hidden subsets: when `size` numbers can only go to the same `size` cells of a unit,
+    remove the other candidates from those cells
+    """
+    N = len(self.sudoku.board)
+    for u, unit in enumerate(self.units) :
+      nums = [num for num in range(N) if 2 <= self.positions[u*N + num].bit_count() <= size]
+      for subset in itertools.combinations(nums, size) :
+        slots = kept_nums = 0
+        for num in subset :
+          slots |= self.positions[u*N + num]
+          kept_nums |= 1 << num
+        if slots.bit_count() == size :
+          for slot in mask_bits(slots) :
+            if not self.eliminate(unit[slot], self.all_nums & ~kept_nums) :
               return False
-            elif len(cell_candidates) == 1 :
-              self.sudoku.board[cell_candidates[0][0]][cell_candidates[0][1]] = num
-              obv_cells.append((cell_candidates[0][0], cell_candidates[0][1]))
-              print("obv_col", cell_candidates, num, obv_cells)
     return True
 
-  def solve_obvious_blocks(self, obv_cells:List=[]) -> bool :
-    """
-    Fill numbers in sub blocks where a digit has only one valid position
-    """
-    if not self.is_board_full() :
-      for i in range(self.sudoku.n) :
-        for j in range(self.sudoku.n) :
-          for num in range(self.sudoku.n**2) :
-            is_num_exist_in_block = False
-            is_cell_safe = lambda r,c,num : self.sudoku.is_cell_empty(self.sudoku.board, r, c) and self.sudoku.is_num_valid(self.sudoku.board, r, c, num)
-            cell_candidates = []
-            for r in range(self.sudoku.n) :
-              if is_num_exist_in_block :
-                break
-              for c in range(self.sudoku.n) :
-                if self.sudoku.board[self.sudoku.n*i+r][self.sudoku.n*j+c] == num :
-                  # print("block", (i,j), "found", num, "on", (self.sudoku.n*i+r, self.sudoku.n*j+c))
-                  is_num_exist_in_block = True
-                  break
-                elif is_cell_safe(self.sudoku.n*i+r, self.sudoku.n*j+c, num) :
-                  cell_candidates.append((self.sudoku.n*i+r, self.sudoku.n*j+c))
-            if not is_num_exist_in_block :
-              if len(cell_candidates) == 0 :
-                print("ohno!", "block", (i,j), "can't put", num)
-                self.unsolve_obvious(obv_cells)
+  def apply_locked_candidates(self, base_units:range, kinds:Tuple[int, ...]) -> bool :
+    """
+    Locked candidates: when the positions of a number in a base unit all lie in a single unit of another kind
+    (0 for rows, 1 for columns, 2 for blocks), remove the number from the rest of that unit
+    """
+    N = len(self.sudoku.board)
+    for u in base_units :
+      for num in range(N) :
+        slots = self.positions[u*N + num]
+        if slots & (slots-1) == 0 :
+          continue
+        cells = [self.units[u][slot] for slot in mask_bits(slots)]
+        for kind in kinds :
+          targets = {self.cell_units[i][kind][0] for i in cells}
+          if len(targets) == 1 :
+            for j in self.units[targets.pop()] :
+              if j not in cells and self.candidates[j] >> num & 1 and not self.eliminate(j, 1 << num) :
                 return False
-              elif len(cell_candidates) == 1 :
-                # print("yay:)", "block", (i,j), "put", num, "in", cell_candidates)
-                self.sudoku.board[cell_candidates[0][0]][cell_candidates[0][1]] = num
-                obv_cells.append((cell_candidates[0][0], cell_candidates[0][1]))
     return True
 
-  def unsolve_obvious(self, obv_cells:List=[]) -> None :
+  def apply_fish(self, size:int) -> bool :
+    """
+    Fish (X-Wing for 2, Swordfish for 3): when a number can only go to the same `size` columns within `size` rows,
+    remove it from those columns on the other rows, and the same with rows and columns swapped
+    """
+    N = len(self.sudoku.board)
+    # Row units are indexed by their row and have their cells in column order, column units the other way around
+    for base, cover in ((0, N), (N, 0)) :
+      for num in range(N) :
+        lines = [u for u in range(base, base+N) if 2 <= self.positions[u*N + num].bit_count() <= size]
+        for subset in itertools.combinations(lines, size) :
+          slots = 0
+          for u in subset :
+            slots |= self.positions[u*N + num]
+          if slots.bit_count() == size :
+            for slot in mask_bits(slots) :
+              for line, j in enumerate(self.units[cover + slot]) :
+                if base + line not in subset and self.candidates[j] >> num & 1 and not self.eliminate(j, 1 << num) :
+                  return False
+    return True
+
+  def undo(self, mark:int) -> None :
+    """
+    Revert the trail down to its first `mark` entries, restoring the board, the candidates and the positions
+    """
+    N = len(self.sudoku.board)
+    while len(self.trail) > mark :
+      i, old_mask = self.trail.pop()
+      if old_mask < 0 :
+        self.cells[i] = EMPTY
+        self.n_empty_cells += 1
+        continue
+      restored = old_mask & ~self.candidates[i]
+      self.candidates[i] = old_mask
+      for u, slot in self.cell_units[i] :
+        nums = restored
+        while nums :
+          num = (nums & -nums).bit_length() - 1
+          nums &= nums - 1
+          self.positions[u*N + num] |= 1 << slot
+
+  def solve(self) -> Optional[dict] :
     """
-    Revert cells filled by 'solve_obvious_<constraint>' methods, restoring the board to its previous state
+    Solve the given unsolved Sudoku board using backtrack algorithm, on an explicit stack instead of recursion
+
+    sudoku: A sudoku object
     """
-    print("about to unsolve", len(obv_cells), "cells", obv_cells)
-    for r, c in obv_cells :
-      print("unsolving", (r,c))
-      self.sudoku.board[r][c] = EMPTY
-    return
+    if not self.is_consistent :
+      if self.trace_level >= TRACE_SEARCH :
+        self.tracer.emit("unsolvable", nodes=self.n_nodes)
+      return None
+    cells, N = self.cells, len(self.sudoku.board)
+    stack = []  # [trail length, searched cell, its candidates, index of the tried candidate] of each level
+    while True :
+      if self.is_board_full() :
+        if self.trace_level >= TRACE_SEARCH :
+          self.tracer.emit("solved", nodes=self.n_nodes)
+        return {(r, c): cells[r*N + c] for r, c in self.empty_cells}
+      # Search the empty cell with the fewest candidates
+      cell, cell_n_candidates = None, N + 1
+      for r, c in self.empty_cells :
+        if cells[r*N + c] == EMPTY :
+          n_candidates = self.candidates[r*N + c].bit_count()
+          if n_candidates < cell_n_candidates :
+            cell, cell_n_candidates = r*N + c, n_candidates
+            if n_candidates <= 2 :
+              break
+      mask = self.candidates[cell]
+      num_candidates = [num for num in range(N) if mask >> num & 1]
+      if self.randomize :
+        random.shuffle(num_candidates)
+      stack.append([len(self.trail), cell, num_candidates, -1])
+      # Try the next candidate of the deepest level, backtracking through the exhausted levels
+      while stack :
+        level = stack[-1]
+        mark, i, num_candidates, k = level
+        self.undo(mark)
+        k += 1
+        if k < len(num_candidates) :
+          level[3] = k
+          self.n_nodes += 1
+          if self.trace_level >= TRACE_SEARCH :
+            self.tracer.emit("branch", depth=len(stack), cell=divmod(i, N), num=num_candidates[k])
+          if self.assign(i, num_candidates[k]) and self.reduce() :
+            break
+          self.queue.clear()
+          continue
+        if self.trace_level >= TRACE_SEARCH :
+          self.tracer.emit("backtrack", depth=len(stack), cell=divmod(i, N))
+        stack.pop()
+      else :
+        if self.trace_level >= TRACE_SEARCH :
+          self.tracer.emit("unsolvable", nodes=self.n_nodes)
+        return None
 
   def is_board_full(self) -> bool :
     """
     Check if all cells of the given sudoku board is filled
     """
-    for r in range(self.sudoku.rows) :
-      for c in range(self.sudoku.cols) :
-        if self.sudoku.is_cell_empty(self.sudoku.board, r, c) :
-          return False
-    return True
+    return self.n_empty_cells == 0
+
+# Elimination strategies of the backtracking solver, on top of the naked and hidden singles it always propagates
+BACKTRACK_STRATEGIES = {
+  "naked_pairs": lambda solver : solver.apply_naked_subsets(2),
+  "naked_triples": lambda solver : solver.apply_naked_subsets(3),
+  "hidden_pairs": lambda solver : solver.apply_hidden_subsets(2),
+  "hidden_triples": lambda solver : solver.apply_hidden_subsets(3),
+  "pointing": lambda solver : solver.apply_locked_candidates(range(2*len(solver.sudoku.board), 3*len(solver.sudoku.board)), (0, 1)),
+  "claiming": lambda solver : solver.apply_locked_candidates(range(2*len(solver.sudoku.board)), (2,)),
+  "x_wing": lambda solver : solver.apply_fish(2),
+  "swordfish": lambda solver : solver.apply_fish(3)
+}
 
 if __name__ == "__main__" :
   sdk = Sudoku(3)
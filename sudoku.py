@@ -1,11 +1,16 @@
-import copy
+import functools
+import heapq
 import math
+import multiprocessing
 import os
 import pprint
 import random
 import time
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
+from board import Board
+from budget import BudgetExhausted, SearchBudget
 from constants import (
   NORMAL_SUDOKU_SYM2INT,
   SUDOKU_4_SYM2INT,
@@ -48,134 +53,146 @@ class Sudoku :
     """
     Assign EMPTY value to all cells in the board
     """
-    self.board = [[EMPTY for _ in range(self.cols)] for _ in range(self.rows)]
+    self.board = Board(self.n)
     self.difficulty = None
     self.solution = None
 
-  def is_cell_empty(self, board:List[List[int]], row:int, col:int) -> bool :
+  def is_cell_empty(self, board:Board, row:int, col:int) -> bool :
     """
     Check if a given cell (row,col) in a given board is EMPTY
     """
     return board[row][col] == EMPTY
 
-  def is_board_valid(self, board:List[List[int]]) -> bool :
+  def is_board_valid(self, board:Board) -> bool :
     """
     Check if a given board is valid/solvable
     """
-    # Helper function to check if a list contains unique non-EMPTY elements
-    def is_list_unique(lst:List[int]):
-      nums = [num for num in lst if num!=EMPTY]
-      return len(nums) == len(set(nums))
-    # Check all rows and columns
-    for row in range(self.rows) :
-      if not is_list_unique(board[row]) :
+    # Check that every row, column and subgrid contains unique non-EMPTY elements
+    for unit in board.units :
+      nums = [board.cells[i] for i in unit if board.cells[i] != EMPTY]
+      if len(nums) != len(set(nums)) :
         return False
-    for col in range(self.cols) :
-      if not is_list_unique([board[row][col] for row in range(self.rows)]) :
-        return False
-    # Check all subgrids
-    for i in range(self.n) :
-      for j in range(self.n) :
-        if not is_list_unique([board[self.n*i+r][self.n*j+c] for r in range(self.n) for c in range(self.n)]) :
-          return False
     return True
 
-  def get_empty_cells(self, board:List[List[int]]) -> List[tuple] :
+  def get_empty_cells(self, board:Board) -> List[tuple] :
     """
     Get all empty cells in a given board
     """
-    empty_cells = []
-    for row in range(self.rows) :
-      for col in range(self.cols) :
-        if self.is_cell_empty(board, row, col) :
-          empty_cells.append((row, col))
-    return empty_cells
+    return [divmod(i, self.cols) for i, num in enumerate(board.cells) if num == EMPTY]
 
-  def get_non_empty_cells(self, board:List[List[int]]) -> List[tuple] :
+  def get_non_empty_cells(self, board:Board) -> List[tuple] :
     """
     Get all non-EMPTY cells in a given board
     """
-    non_empty_cells = []
-    for row in range(self.rows) :
-      for col in range(self.cols) :
-        if not self.is_cell_empty(board, row, col) :
-          non_empty_cells.append((row,col))
-    return non_empty_cells
+    return [divmod(i, self.cols) for i, num in enumerate(board.cells) if num != EMPTY]
 
-  def get_num_candidates(self, board:List[List[int]], row:int, col:int) -> List[int] :
+  def get_num_candidates(self, board:Board, row:int, col:int) -> List[int] :
     """
     Get all candidate numbers for a cell on a given board
     """
-    all_candidates = set(range(self.n**2))
-    existing_candidates = set()
-    for i in range(self.n**2) :
-      if not self.is_cell_empty(board, row, i) and i!=col :
-        existing_candidates.add(board[row][i])
-      if not self.is_cell_empty(board, i, col) and i!=row :
-        existing_candidates.add(board[i][col])
-    start_row, start_col = self.n * (row // self.n), self.n * (col // self.n)
-    for i in range(self.n) :
-      for j in range(self.n) :
-        if not self.is_cell_empty(board, start_row+i, start_col+j) and (start_row+i!=row or start_col+j!=col) :
-          existing_candidates.add(board[start_row+i][start_col+j])
-    return list(all_candidates.difference(existing_candidates))
-
-  def has_one_solution(self, board:List[List[int]]) -> bool :
+    cells = board.cells
+    existing_candidates = {cells[i] for i in board.peers[row*self.cols + col]}
+    return [num for num in range(self.n**2) if num not in existing_candidates]
+
+  def has_one_solution(self, board:Board) -> bool :
     """
     Check if a given board has exactly one solution.
     Returns True if there's exactly one solution, False otherwise.
     """
-    # Make a copy of the board to avoid modifying the original
-    board_copy = copy.deepcopy(board)
-    # Helper function to recursively check for solutions
-    def count_solutions(empty_cells:List[tuple], idx:int=0) -> int :
-      if idx == len(empty_cells) :
-        return 1
-      row, col = empty_cells[idx]
-      n_solutions = 0
-      for num_candidate in self.get_num_candidates(board_copy, row, col) :
-        if self.is_num_valid(board_copy, row, col, num_candidate) :
-          board_copy[row][col] = num_candidate
-          n_solutions += count_solutions(empty_cells, idx+1)
-          if n_solutions > 1 :
-            return n_solutions
-          board_copy[row][col] = EMPTY
-      return n_solutions
-    if not self.is_board_valid(board_copy) :
+    # The count restores the board, so it runs on the given board itself
+    if not self.is_board_valid(board) :
       print("not valid")
       return False
-    empty_cells = self.get_empty_cells(board_copy)
-    return count_solutions(empty_cells) == 1
+    return self.count_solutions(board, limit=2) == 1
 
-  def has_one_solution_algx(self) :
+  def has_one_solution_algx(self) -> bool :
+    """
+    Check if the current board has exactly one solution, using Algorithm X.
+    The search stops as soon as a second solution is found
+    """
     from solver import AlgXSudokuSolver
     solver = AlgXSudokuSolver(self)
-    return len(solver.solve()) == 1
+    return solver.count_solutions(limit=2) == 1
 
-  def get_n_solutions(self, board:List[List[int]]) -> int :
+  def get_n_solutions(self, board:Board) -> int :
     """
     Get the number of possible solutions of a given board
     """
-    # Helper function to recursively count solutions of sudoku board
-    def count_solutions(empty_cells:List[tuple], idx:int=0) :
-      if idx == len(empty_cells) :
-        return 1
-      row, col = empty_cells[idx]
-      total_solutions = 0
-      for num_candidate in self.get_num_candidates(board, row, col) :
-        if self.is_num_valid(board, row, col, num_candidate) :
-          board[row][col] = num_candidate
-          total_solutions += count_solutions(empty_cells, idx+1)
-          board[row][col] = EMPTY
-      return total_solutions
     if not self.is_board_valid(board) :
       print("not valid")
       return 0
+    return self.count_solutions(board)
+
+  def has_other_solution(self, board:Board, removed_cell_to_num:dict, budget:Optional[SearchBudget]=None) -> bool :
+    """
+    Check if a board that had exactly one solution has another one after emptying the cells of `removed_cell_to_num`
+    """
+    # Any other solution puts a different number on one of the emptied cells, so each of them gets one search with
+    # its former number forbidden, and gets that number back during the next searches so no subtree is searched twice
+    has_other = False
+    try :
+      for (row, col), num in removed_cell_to_num.items() :
+        if self.count_solutions(board, limit=1, excluded={(row, col): num}, budget=budget) > 0 :
+          has_other = True
+          break
+        board[row][col] = num
+    finally :
+      for row, col in removed_cell_to_num :
+        board[row][col] = EMPTY
+    return has_other
+
+  def count_solutions(self, board:Board, limit:Optional[int]=None, excluded:Optional[dict]=None, budget:Optional[SearchBudget]=None) -> int :
+    """
+    Count the solutions of a given board by backtracking on an explicit stack, always branching on the empty cell
+    with the fewest candidates, and stop as soon as `limit` solutions are found. The board is left as it was given
+
+    excluded: Numbers that are forbidden on some of the empty cells, keyed by cell
+    budget: Charged one node per tried candidate, the count raises BudgetExhausted once it is used up
+    """
     empty_cells = self.get_empty_cells(board)
-    return count_solutions(empty_cells)
+    stack = []  # [cell, candidates, index of the tried candidate] of each filled empty cell
+    n_solutions = 0
+    try :
+      while True :
+        if len(stack) == len(empty_cells) :
+          n_solutions += 1
+          if n_solutions == limit :
+            break
+        else :
+          best_cell, best_candidates = None, None
+          for row, col in empty_cells :
+            if board[row][col] != EMPTY :
+              continue
+            num_candidates = self.get_num_candidates(board, row, col)
+            if excluded and excluded.get((row, col)) in num_candidates :
+              num_candidates.remove(excluded[(row, col)])
+            if best_cell is None or len(num_candidates) < len(best_candidates) :
+              best_cell, best_candidates = (row, col), num_candidates
+              if len(num_candidates) <= 1 :
+                break
+          stack.append([best_cell, best_candidates, -1])
+        # Try the next candidate of the deepest cell, backtracking through the exhausted cells
+        while stack :
+          (row, col), num_candidates, k = stack[-1]
+          k += 1
+          if k < len(num_candidates) :
+            board[row][col] = num_candidates[k]
+            stack[-1][2] = k
+            if budget is not None :
+              budget.spend()
+            break
+          board[row][col] = EMPTY
+          stack.pop()
+        else :
+          break
+    finally :
+      # Empty the cells that are still filled if the count stopped early
+      for (row, col), _, _ in stack :
+        board[row][col] = EMPTY
+    return n_solutions
 
-  def generate_new_puzzle(self, difficulty:str="medium", mode:str="linear", symmetric:bool=True) -> None :
-    assert difficulty in ["easy", "medium", "hard", "extreme"]
+  def get_non_empty_cells_threshold(self, difficulty:str="medium", mode:str="linear") -> int :
+    assert difficulty in ["easy", "medium", "hard", "extreme", "minimal"]
     assert mode in ["linear", "exp"]
     """
     Number of non-empty cells for each difficulty is as follows
@@ -195,7 +212,11 @@ class Sudoku :
     n=3, remove ~22.45319999999999
     n=4, remove ~98.71359999999999
     n=5, remove ~308.75
+    Minimal
+    no threshold, cells are removed until every clue left is necessary
     """
+    if difficulty == "minimal" :
+      return 0
     if difficulty == "easy" :
       f_n = {
         "linear": lambda n : -.1269*n+.876,
@@ -217,297 +238,363 @@ class Sudoku :
         "exp": lambda n : 1.22242*.840011**n
       }
     n_cells_to_be_removed = math.ceil(f_n[mode](self.n)*(self.n**2)**2)
-    non_empty_cells_threshold = (self.n**2)**2 - n_cells_to_be_removed
+    return (self.n**2)**2 - n_cells_to_be_removed
+
+  def generate_new_puzzle(self, difficulty:str="medium", mode:str="linear", symmetric:bool=True, oracle:str="backtrack", fill_mode:str="mrv",
+                          attempts:int=1, parallel:bool=False, lookahead:int=1, deadline:Optional[float]=None,
+                          node_budget:Optional[int]=None) -> int :
+    """
+    Generate a new puzzle with a unique solution by randomly filling the board and emptying cells while the solution stays unique.
+    Up to `attempts` puzzles are generated until one lands within 2 clues of the difficulty's clue count, otherwise the one with
+    the fewest clues is kept. Returns how many clues the kept puzzle has above the difficulty's clue count (negative if below).
+    The "minimal" difficulty has no clue count: every cell is tested once, so every clue left is necessary to the unique
+    solution. A clue is only necessary on its own, so minimal puzzles are not made symmetric
+
+    oracle: Uniqueness check of every removal, "backtrack" searches the board itself and "algx" keeps an exact cover session
+    fill_mode: How the full grid is drawn, see randomly_fill_board
+    parallel: Run the attempts at the same time in worker processes instead of one after another
+    lookahead: Number of removals checked at the same time in worker processes, see remove_cells.
+               Parallel attempts can't start worker processes of their own, so they only take lookahead=1
+    deadline: Seconds after which the removals stop, the board is then the best unique puzzle found so far
+    node_budget: Search nodes the uniqueness checks may spend in total (per attempt if parallel), a reproducible
+                 alternative to the deadline. Neither limit applies to the checks of a lookahead, so both need lookahead=1
+    """
+    assert oracle in ["backtrack", "algx"]
+    assert attempts >= 1
+    assert lookahead == 1 or not (parallel and attempts > 1), "parallel attempts don't take a lookahead"
+    assert lookahead == 1 or (deadline is None and node_budget is None), "the speculative checks of a lookahead are not budgeted"
+    non_empty_cells_threshold = self.get_non_empty_cells_threshold(difficulty, mode)
     lower_bound = non_empty_cells_threshold-2
     upper_bound = non_empty_cells_threshold+2
+    if difficulty == "minimal" :
+      symmetric = False
+      lower_bound, upper_bound = 0, math.inf
+    budget = SearchBudget(deadline, node_budget) if deadline is not None or node_budget is not None else None
+    if parallel and attempts > 1 :
+      self.run_parallel_attempts(difficulty, mode, symmetric, oracle, fill_mode, attempts, lower_bound, upper_bound, budget)
+      return len(self.get_non_empty_cells(self.board)) - non_empty_cells_threshold
 
     puzzle_found = False
-    retries = 1
+    retries = attempts
     min_n_non_empty_cells = math.inf
-    best_puzzle = None
+    best_solution, best_removed_cells = None, None
     ns = []
     while not puzzle_found and retries!=0 :
       # Reset the board and randomly fill the board
       self.reset_board()
-      self.randomly_fill_board()
+      self.randomly_fill_board(fill_mode)
       self.difficulty = difficulty
       self.solution = {(r, c): self.board[r][c] for c in range(self.cols) for r in range(self.rows)}
-      # Get all the initial non-empty cells in the board
-      non_empty_cells = self.get_non_empty_cells(self.board)
-      random.shuffle(non_empty_cells)
-      n_non_empty_cells = len(non_empty_cells)
-      # Additional parameters
-      removed_cells = set()
-      removal_strat = True  # False -> prioritize removing least constrained cells (most number of candidates);
-                            # True -> prioritize removing most constrained cells (least number of candidates)
-      if symmetric :
-        mirror_cond = lambda x, y, n : [
-          x != y,                             # \
-          x + y + 1 != n**2,                  # /
-          (n%2 == 0) or (x != n**2//2),       # -
-          (n%2 == 0) or (y != n**2//2),       # |
-          ((x != n**2//2) or (y != n**2//2))  # ·
-        ]
-        mirror_fn = lambda x, y, n : [
-          (y, x),               # \
-          (n**2-1-y, n**2-1-x), # /
-          (n**2-1-x, y),        # -
-          (x, n**2-1-y),        # |
-          (n**2-1-x, n**2-1-y)  # ·
-        ]
-        axis_id = random.randint(0,4)
-        while len(non_empty_cells) and n_non_empty_cells >= non_empty_cells_threshold :
-          # Store all cells to be emptied
-          row, col = non_empty_cells.pop()
-          # print("emptying", (row,col), len(self.get_num_candidates(self.board, row, col)))
-          row_mirror, col_mirror = mirror_fn(row, col, self.n)[axis_id] if mirror_cond(row, col, self.n)[axis_id] else (None, None)
-          cells_to_process = [(row, col)]
-          # print(f"({row, col}) and ({row_mirror, col_mirror})", (row, col) in non_empty_cells, (row_mirror, col_mirror) in non_empty_cells)
-          if row_mirror is not None and col_mirror is not None :
-            cells_to_process.append((row_mirror, col_mirror))
-            non_empty_cells.remove((row_mirror, col_mirror))
-          # Store removed numbers
-          removed_cell_to_num = {}
-          for r, c in cells_to_process :
-            n_non_empty_cells -= 1
-            removed_cell_to_num[(r, c)] = self.board[r][c]
-            self.board[r][c] = EMPTY
-          # Check if there is only one solution
-          board_copy = copy.deepcopy(self.board)
-          if not self.has_one_solution(board_copy) :
-            # If multiple solutions, revert the numbers removal
-            for r, c in cells_to_process :
-              n_non_empty_cells += 1
-              self.board[r][c] = removed_cell_to_num[(r, c)]
-              removed_cells.add((r, c))
-            # print("GAGAL: appending", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, f"({row, col}) and ({row_mirror, col_mirror})", removed_cells)
-          else :
-            # Otherwise, the removal succeeded, update back the non_empty_cells
-            non_empty_cells.extend(removed_cells)
-            removed_cells.clear()
-            non_empty_cells = sorted(
-              non_empty_cells,
-              key=lambda cell: len(self.get_num_candidates(self.board, cell[0], cell[1]))
-                                + (len(self.get_num_candidates(self.board, row_mirror, col_mirror)) if row_mirror is not None and col_mirror is not None else 0),
-              reverse=removal_strat
-            )
-            # print("SUCCESS: clearing", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, f"({row, col}) and ({row_mirror, col_mirror})", removed_cells)
-      else :
-        while len(non_empty_cells) and n_non_empty_cells >= non_empty_cells_threshold :
-          row, col = non_empty_cells.pop()
-          # print("emptying", (row,col), len(self.get_num_candidates(self.board, row, col)))
-          n_non_empty_cells -= 1
-          removed_num = self.board[row][col]
-          self.board[row][col] = EMPTY
-          board_copy = copy.deepcopy(self.board)
-          if not self.has_one_solution(board_copy) :
-            n_non_empty_cells += 1
-            self.board[row][col] = removed_num
-            removed_cells.add((row, col))
-            # print("GAGAL: appending", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, removed_cells)
-          else :
-            non_empty_cells.extend(removed_cells)
-            removed_cells.clear()
-            non_empty_cells = sorted(
-              non_empty_cells,
-              key=lambda cell: len(self.get_num_candidates(self.board, cell[0], cell[1])),
-              reverse=removal_strat
-            )
-            # print("SUCCESS: clearing", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, removed_cells)
-      puzzle_found = lower_bound<=len(self.get_non_empty_cells(self.board))<=upper_bound
+      removals = self.remove_cells(non_empty_cells_threshold, symmetric, oracle, lookahead, budget)
+      n_non_empty_cells = self.rows*self.cols - len(removals)
+      puzzle_found = lower_bound<=n_non_empty_cells<=upper_bound
       retries -= 1
       ns.append(n_non_empty_cells)
       if n_non_empty_cells < min_n_non_empty_cells :
         min_n_non_empty_cells = n_non_empty_cells
-        best_puzzle = copy.deepcopy(self.board)
-    self.board = best_puzzle
+        best_solution, best_removed_cells = self.solution, [cell for cell, _ in removals]
+      # Out of budget, the removals stopped early and no other attempt is started
+      if budget is not None and budget.is_exhausted() :
+        break
+    # The best puzzle is kept as its solution and removed cells, rebuild it if a later attempt took the board
+    if best_solution is not self.solution :
+      self.solution = best_solution
+      for (r, c), num in best_solution.items() :
+        self.board[r][c] = num
+      for r, c in best_removed_cells :
+        self.board[r][c] = EMPTY
     # print(ns)
-    return
+    return min_n_non_empty_cells - non_empty_cells_threshold
 
-  def generate_new_puzzle_algx(self, difficulty:str="medium", mode:str="linear", symmetric:bool=True) -> None :
-    assert difficulty in ["easy", "medium", "hard", "extreme"]
-    assert mode in ["linear", "exp"]
+  def run_parallel_attempts(self, difficulty:str, mode:str, symmetric:bool, oracle:str, fill_mode:str, attempts:int,
+                            lower_bound:int, upper_bound:int, budget:Optional[SearchBudget]=None) -> None :
     """
-    Number of non-empty cells for each difficulty is as follows
-    Easy
-    n=3, remove ~40.880700000000004
-    n=4, remove ~161.6896
-    n=5, remove ~474.0625
-    Medium
-    n=3, remove ~34.749
-    n=4, remove ~140.74880000000002
-    n=5, remove ~419.125
-    Hard
-    n=3, remove ~28.584899999999998
-    n=4, remove ~119.68
-    n=5, remove ~363.81249999999994
-    Extreme
-    n=3, remove ~22.45319999999999
-    n=4, remove ~98.71359999999999
-    n=5, remove ~308.75
+    Generate `attempts` puzzles at the same time in worker processes, each from its own seed drawn from `random`.
+    The first one within [lower_bound, upper_bound] clues is taken and the attempts still running are stopped,
+    otherwise the one with the fewest clues is taken once all of them finished.
+    Every attempt gets its own copy of `budget`, all of them expiring at its deadline
     """
-    if difficulty == "easy" :
-      f_n = {
-        "linear": lambda n : -.1269*n+.876,
-        "exp": lambda n : 1.39829*.709631**n
-      }
-    elif difficulty == "medium" :
-      f_n = {
-        "linear": lambda n : -.1208*n+.9334,
-        "exp": lambda n : 1.27574*.766428**n
-      }
-    elif difficulty == "hard" :
-      f_n = {
-        "linear": lambda n : -.1146*n+.9909,
-        "exp": lambda n : 1.23031*.808136**n
-      }
-    else :
-      f_n = {
-        "linear": lambda n : -.1084*n+1.048,
-        "exp": lambda n : 1.22242*.840011**n
-      }
-    n_cells_to_be_removed = math.ceil(f_n[mode](self.n)*(self.n**2)**2)
-    non_empty_cells_threshold = (self.n**2)**2 - n_cells_to_be_removed
-    lower_bound = non_empty_cells_threshold-2
-    upper_bound = non_empty_cells_threshold+2
+    from batch import decode_payload, generate_payload
+    seeds = [random.getrandbits(64) for _ in range(attempts)]
+    best_puzzle, min_n_non_empty_cells = None, math.inf
+    # A multiprocessing pool rather than an executor, since only terminating the pool stops the attempts already running
+    pool = multiprocessing.Pool(min(attempts, os.cpu_count() or 1))
+    try :
+      for payload in pool.imap_unordered(functools.partial(generate_payload, self.n, difficulty, mode, symmetric, oracle, fill_mode=fill_mode, budget=budget), seeds) :
+        puzzle = decode_payload(self.n, payload)
+        n_non_empty_cells = len(self.get_non_empty_cells(puzzle.board))
+        if n_non_empty_cells < min_n_non_empty_cells :
+          best_puzzle, min_n_non_empty_cells = puzzle, n_non_empty_cells
+        if lower_bound<=n_non_empty_cells<=upper_bound :
+          best_puzzle = puzzle
+          break
+    finally :
+      pool.terminate()
+      pool.join()
+    self.board.cells[:] = best_puzzle.board.cells
+    self.solution = best_puzzle.solution
+    self.difficulty = difficulty
 
-    puzzle_found = False
-    retries = 1
-    min_n_non_empty_cells = math.inf
-    best_puzzle = None
-    ns = []
-    while not puzzle_found and retries!=0 :
-      # Reset the board and randomly fill the board
-      self.reset_board()
-      self.randomly_fill_board()
-      self.difficulty = difficulty
-      self.solution = {(r, c): self.board[r][c] for c in range(self.cols) for r in range(self.rows)}
-      # Get all the initial non-empty cells in the board
-      non_empty_cells = self.get_non_empty_cells(self.board)
-      random.shuffle(non_empty_cells)
-      n_non_empty_cells = len(non_empty_cells)
-      # Additional parameters
-      removed_cells = set()
-      removal_strat = True  # False -> prioritize removing least constrained cells (most number of candidates);
-                            # True -> prioritize removing most constrained cells (least number of candidates)
-      if symmetric :
-        mirror_cond = lambda x, y, n : [
-          x != y,                             # \
-          x + y + 1 != n**2,                  # /
-          (n%2 == 0) or (x != n**2//2),       # -
-          (n%2 == 0) or (y != n**2//2),       # |
-          ((x != n**2//2) or (y != n**2//2))  # ·
-        ]
-        mirror_fn = lambda x, y, n : [
-          (y, x),               # \
-          (n**2-1-y, n**2-1-x), # /
-          (n**2-1-x, y),        # -
-          (x, n**2-1-y),        # |
-          (n**2-1-x, n**2-1-y)  # ·
-        ]
-        axis_id = random.randint(0,4)
-        while len(non_empty_cells) and n_non_empty_cells >= non_empty_cells_threshold :
-          # Store all cells to be emptied
-          row, col = non_empty_cells.pop()
-          # print("emptying", (row,col), len(self.get_num_candidates(self.board, row, col)))
-          row_mirror, col_mirror = mirror_fn(row, col, self.n)[axis_id] if mirror_cond(row, col, self.n)[axis_id] else (None, None)
+  def generate_new_puzzle_algx(self, difficulty:str="medium", mode:str="linear", symmetric:bool=True, fill_mode:str="mrv") -> int :
+    """
+    Generate a new puzzle like generate_new_puzzle, checking the uniqueness of every removal with Algorithm X
+    """
+    return self.generate_new_puzzle(difficulty, mode, symmetric, oracle="algx", fill_mode=fill_mode)
+
+  def remove_cells(self, non_empty_cells_threshold:int, symmetric:bool=True, oracle:str="backtrack", lookahead:int=1,
+                   budget:Optional[SearchBudget]=None) -> List[tuple] :
+    """
+    Empty the cells of the filled board one by one (or with their mirror cell if symmetric) while the solution stays unique,
+    until less than `non_empty_cells_threshold` cells are left or no cell can be emptied anymore.
+    The board is changed in place: every removal is logged in an undo trail and a rejected one is reverted from it,
+    so no board is ever copied. Returns the trail of kept ((row, col), number) removals
+
+    lookahead: Number of removals checked speculatively at once in worker processes, their verdicts are then committed in order
+    budget: Shared by the uniqueness checks, once it runs out the pending removal is reverted and the loop stops,
+            so the board is always left as a puzzle with a unique solution
+    """
+    from solver import AlgXSudokuSession
+    assert lookahead == 1 or budget is None
+    # Keep one exact cover session for the whole removal loop, givens are added and removed incrementally.
+    # With a lookahead the verdicts come from the worker processes, so no session is kept
+    session = AlgXSudokuSession(self) if oracle == "algx" and lookahead == 1 else None
+    if session is not None :
+      session.algx.budget = budget
+    board, cells = self.board, self.board.cells
+    # Get all the initial non-empty cells in the board
+    non_empty_cells = self.get_non_empty_cells(board)
+    random.shuffle(non_empty_cells)
+    n_non_empty_cells = len(non_empty_cells)
+    # Undo trail of ((row, col), number) removals
+    removals = []
+    # Additional parameters
+    removal_strat = True  # False -> prioritize removing least constrained cells (most number of candidates);
+                          # True -> prioritize removing most constrained cells (least number of candidates)
+    # Removal queue: a heap of (candidate count, shuffled rank, cell) entries, popping the fewest (or most) candidates first
+    # and the latest shuffled cell among ties. An entry is stale once its cell left the queue or its count changed.
+    # A rejected cell never goes back in the queue: emptying more cells only adds solutions, so once its removal
+    # lets another solution in, that cell stays necessary to every later puzzle and retesting it would always fail
+    sign = 1 if removal_strat else -1
+    rank = {row*self.cols + col: k for k, (row, col) in enumerate(non_empty_cells)}
+    # Numbers on every unit, the candidates of a cell are the numbers missing from its units besides its own
+    unit_nums = [0] * len(board.units)
+    for u, unit in enumerate(board.units) :
+      for i in unit :
+        if cells[i] != EMPTY :
+          unit_nums[u] |= 1 << cells[i]
+    def count_candidates(i:int) -> int :
+      nums = 0
+      for u, _ in board.cell_units[i] :
+        nums |= unit_nums[u]
+      if cells[i] != EMPTY :
+        nums &= ~(1 << cells[i])
+      return self.rows - nums.bit_count()
+    n_candidates = [count_candidates(i) for i in range(self.rows*self.cols)]
+    is_queued = [False] * (self.rows*self.cols)
+    queue = []
+    def enqueue(i:int) -> None :
+      is_queued[i] = True
+      heapq.heappush(queue, (sign*n_candidates[i], -rank[i], i))
+    def set_cell(i:int, num:int) -> None :
+      # Update the unit numbers, then the candidate counts of the cell and its peers only
+      for u, _ in board.cell_units[i] :
+        unit_nums[u] ^= 1 << (num if num != EMPTY else cells[i])
+      cells[i] = num
+      for j in [i] + board.peers[i] :
+        count = count_candidates(j)
+        if count != n_candidates[j] :
+          n_candidates[j] = count
+          if is_queued[j] :
+            heapq.heappush(queue, (sign*count, -rank[j], j))
+    for i in rank :
+      enqueue(i)
+    n_queued = len(rank)
+    mirror_fn = lambda x, y, n : [
+      (y, x),               # \
+      (n**2-1-y, n**2-1-x), # /
+      (n**2-1-x, y),        # -
+      (x, n**2-1-y),        # |
+      (n**2-1-x, n**2-1-y)  # ·
+    ]
+    axis_id = random.randint(0,4) if symmetric else None
+    # With a lookahead, the next removals are checked at the same time in worker processes against the current board
+    executor = ProcessPoolExecutor(min(lookahead, os.cpu_count() or 1)) if lookahead > 1 else None
+    out_of_budget = False
+    try :
+      while n_queued and n_non_empty_cells >= non_empty_cells_threshold and not out_of_budget :
+        # Pop the next `lookahead` groups of cells to be emptied, a cell with its mirror cell, skipping the stale entries
+        groups = []
+        while n_queued and len(groups) < lookahead :
+          count, _, i = heapq.heappop(queue)
+          if not is_queued[i] or count != sign*n_candidates[i] :
+            continue
+          is_queued[i] = False
+          n_queued -= 1
+          row, col = divmod(i, self.cols)
+          # print("emptying", (row,col), n_candidates[i])
           cells_to_process = [(row, col)]
-          # print(f"({row, col}) and ({row_mirror, col_mirror})", (row, col) in non_empty_cells, (row_mirror, col_mirror) in non_empty_cells)
-          if row_mirror is not None and col_mirror is not None :
-            cells_to_process.append((row_mirror, col_mirror))
-            non_empty_cells.remove((row_mirror, col_mirror))
-          # Store removed numbers
-          removed_cell_to_num = {}
+          if symmetric :
+            # A cell on the axis is its own mirror, and a mirror that already left the queue is not taken along
+            row_mirror, col_mirror = mirror_fn(row, col, self.n)[axis_id]
+            i_mirror = row_mirror*self.cols + col_mirror
+            if i_mirror != i and is_queued[i_mirror] :
+              cells_to_process.append((row_mirror, col_mirror))
+              is_queued[i_mirror] = False
+              n_queued -= 1
+          groups.append(cells_to_process)
+        if executor is not None :
+          from batch import check_removal
+          snapshot = cells.tobytes()
+          futures = [
+            executor.submit(check_removal, self.n, snapshot, {(r, c): board[r][c] for r, c in cells_to_process}, oracle)
+            for cells_to_process in groups
+          ]
+        committed = False
+        for k, cells_to_process in enumerate(groups) :
+          if n_non_empty_cells < non_empty_cells_threshold :
+            break
+          has_other = None
+          if executor is not None :
+            has_other = futures[k].result()
+            # A check ran on the board before the removals committed earlier in this round,
+            # an other solution verdict still holds (see the removal queue) but a unique one is checked again
+            if committed and not has_other :
+              for r, c in cells_to_process :
+                enqueue(r*self.cols + c)
+              n_queued += len(cells_to_process)
+              continue
+            if has_other :
+              continue
+          # Log the removed numbers
+          mark = len(removals)
           for r, c in cells_to_process :
             n_non_empty_cells -= 1
-            removed_cell_to_num[(r, c)] = self.board[r][c]
-            self.board[r][c] = EMPTY
-          # Check if there is only one solution
-          board_copy = copy.deepcopy(self.board)
-          if not self.has_one_solution_algx() :
-            # If multiple solutions, revert the numbers removal
-            for r, c in cells_to_process :
+            removals.append(((r, c), board[r][c]))
+            set_cell(r*self.cols + c, EMPTY)
+            if session is not None :
+              session.remove_given(r, c)
+          # Check if there is still only one solution
+          if has_other is None :
+            removed_cell_to_num = dict(removals[mark:])
+            try :
+              if session is not None :
+                has_other = session.has_other_solution(removed_cell_to_num)
+              else :
+                has_other = self.has_other_solution(board, removed_cell_to_num, budget)
+            except BudgetExhausted :
+              # The check was cut short, so the removal is reverted like a rejected one and the loop stops
+              out_of_budget = has_other = True
+          if has_other :
+            # If multiple solutions, revert the numbers removal down to the mark of the trail
+            while len(removals) > mark :
+              (r, c), num = removals.pop()
               n_non_empty_cells += 1
-              self.board[r][c] = removed_cell_to_num[(r, c)]
-              removed_cells.add((r, c))
-            # print("GAGAL: appending", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, f"({row, col}) and ({row_mirror, col_mirror})", removed_cells)
-          else :
-            # Otherwise, the removal succeeded, update back the non_empty_cells
-            non_empty_cells.extend(removed_cells)
-            removed_cells.clear()
-            non_empty_cells = sorted(
-              non_empty_cells,
-              key=lambda cell: len(self.get_num_candidates(self.board, cell[0], cell[1]))
-                                + (len(self.get_num_candidates(self.board, row_mirror, col_mirror)) if row_mirror is not None and col_mirror is not None else 0),
-              reverse=removal_strat
-            )
-            # print("SUCCESS: clearing", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, f"({row, col}) and ({row_mirror, col_mirror})", removed_cells)
-      else :
-        while len(non_empty_cells) and n_non_empty_cells >= non_empty_cells_threshold :
-          row, col = non_empty_cells.pop()
-          # print("emptying", (row,col), len(self.get_num_candidates(self.board, row, col)))
-          n_non_empty_cells -= 1
-          removed_num = self.board[row][col]
-          self.board[row][col] = EMPTY
-          board_copy = copy.deepcopy(self.board)
-          if not self.has_one_solution(board_copy) :
-            n_non_empty_cells += 1
-            self.board[row][col] = removed_num
-            removed_cells.add((row, col))
-            # print("GAGAL: appending", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, removed_cells)
+              set_cell(r*self.cols + c, num)
+              if session is not None :
+                session.add_given(r, c, num)
+            # print("GAGAL:", n_non_empty_cells, n_queued, non_empty_cells_threshold, cells_to_process)
+            if out_of_budget :
+              break
           else :
-            non_empty_cells.extend(removed_cells)
-            removed_cells.clear()
-            non_empty_cells = sorted(
-              non_empty_cells,
-              key=lambda cell: len(self.get_num_candidates(self.board, cell[0], cell[1])),
-              reverse=removal_strat
-            )
-            # print("SUCCESS: clearing", n_non_empty_cells, len(non_empty_cells), non_empty_cells_threshold, removed_cells)
-      puzzle_found = lower_bound<=len(self.get_non_empty_cells(self.board))<=upper_bound
-      retries -= 1
-      ns.append(n_non_empty_cells)
-      if n_non_empty_cells < min_n_non_empty_cells :
-        min_n_non_empty_cells = n_non_empty_cells
-        best_puzzle = copy.deepcopy(self.board)
-    self.board = best_puzzle
-    # print(ns)
-    return
+            committed = True
+            # print("SUCCESS:", n_non_empty_cells, n_queued, non_empty_cells_threshold, cells_to_process)
+    finally :
+      if executor is not None :
+        executor.shutdown(cancel_futures=True)
+    return removals
 
-  def is_num_valid(self, board:List[List[int]], row:int, col:int, num:int) -> bool :
+  def is_num_valid(self, board:Board, row:int, col:int, num:int) -> bool :
     """
     Check if a number candidate is valid to be put in a given cell on a given board
     """
-    # Check if the number is in the current row or column
-    for i in range(self.n**2) :
-      if board[row][i] == num or board[i][col] == num :
-        return False
-    # Check if the number is in the current subgrid
-    start_row, start_col = self.n * (row // self.n), self.n * (col // self.n)
-    for i in range(self.n) :
-      for j in range(self.n) :
-        if board[start_row + i][start_col + j] == num :
-          return False
-    return True
+    # Check if the number is in the cell itself or in its row, column or subgrid
+    cells = board.cells
+    i = row*self.cols + col
+    return cells[i] != num and all(cells[j] != num for j in board.peers[i])
+
+  def randomly_fill_board(self, mode:str="mrv") -> bool :
+    """
+    Randomly fill the board, keeping the numbers already on it
 
-  def randomly_fill_board(self) :
-    """
-    Randomly fill the board using backtrack
-    """
-    for row in range(self.rows) :
-      for col in range(self.cols) :
-        if self.is_cell_empty(self.board, row, col) :
-          num_candidates = self.get_num_candidates(self.board, row, col)
-          random.shuffle(num_candidates)
-          for num_candidate in num_candidates :
-            if self.is_num_valid(self.board, row, col, num_candidate) :
-              self.board[row][col] = num_candidate
-              if self.randomly_fill_board() :
-                return True
-              self.board[row][col] = EMPTY
-          return False
+    mode: "mrv" runs the bitmask propagation solver, branching on the empty cell with the fewest candidates
+          (random among ties) and trying its candidates in random order. "pattern" derives the grid from a base pattern
+          with a random transform, which only works on an empty board
+    """
+    assert mode in ["mrv", "pattern"]
+    board, cells, N = self.board, self.board.cells, self.rows
+    if mode == "pattern" :
+      assert not self.get_non_empty_cells(board), "pattern fill needs an empty board"
+      pattern = Board(self.n)
+      for i in range(N*N) :
+        r, c = divmod(i, N)
+        pattern.cells[i] = (self.n*(r%self.n) + r//self.n + c) % N
+      cells[:] = self.transform_board(pattern, self.get_random_transform()).cells
+      return True
+    from solver import BacktrackSudokuSolver
+    solution = BacktrackSudokuSolver(self, randomize=True).solve()
+    if solution is None :
+      return False
+    for (r, c), num in solution.items() :
+      board[r][c] = num
     return True
 
+  def get_random_transform(self) -> Tuple[List[int], List[int], List[int], bool] :
+    """
+    Draw a random validity preserving transform: a relabelling of the numbers, an order of the rows made of an order
+    of the bands and an order of the rows within each band, the same for the columns with stacks, and a transposition or not
+    """
+    n = self.n
+    def get_line_order() -> List[int] :
+      order = []
+      for band in random.sample(range(n), n) :
+        order.extend(n*band + i for i in random.sample(range(n), n))
+      return order
+    return random.sample(range(n**2), n**2), get_line_order(), get_line_order(), random.random() < .5
+
+  def transform_board(self, board:Board, transform:Tuple[List[int], List[int], List[int], bool]) -> Board :
+    """
+    Get a transformed copy of a board: cell (r, c) of the copy holds the relabelled number of cell (rows[r], cols[c])
+    of the board, or of its transpose
+    """
+    num_map, rows, cols, transpose = transform
+    N = self.rows
+    new_board = Board(self.n)
+    src, dst = board.cells, new_board.cells
+    for r in range(N) :
+      for c in range(N) :
+        num = src[cols[c]*N + rows[r]] if transpose else src[rows[r]*N + cols[c]]
+        if num != EMPTY :
+          dst[r*N + c] = num_map[num]
+    return new_board
+
+  def derive_puzzles(self, k:int) -> List["Sudoku"] :
+    """
+    Derive k puzzles equivalent to the current one, each under its own random validity preserving transform
+    (relabelling, band/stack orders, row/column orders within them and transposition, which include the rotations
+    and reflections), with their solution carried along. Clue count, uniqueness and difficulty are invariant
+    under these transforms, so the derived puzzles are not checked again
+    """
+    assert self.solution is not None, "the puzzle has no solution to carry along"
+    puzzles = []
+    for _ in range(k) :
+      transform = self.get_random_transform()
+      _, rows, cols, transpose = transform
+      # Rows and columns of the derived board where the old rows and columns end up
+      row_pos, col_pos = [0] * self.rows, [0] * self.cols
+      for r, old_r in enumerate(rows) :
+        row_pos[old_r] = r
+      for c, old_c in enumerate(cols) :
+        col_pos[old_c] = c
+      sudoku = Sudoku(self.n)
+      sudoku.board = self.transform_board(self.board, transform)
+      sudoku.difficulty = self.difficulty
+      sudoku.solution = {
+        ((row_pos[c], col_pos[r]) if transpose else (row_pos[r], col_pos[c])): transform[0][num]
+        for (r, c), num in self.solution.items()
+      }
+      puzzles.append(sudoku)
+    return puzzles
+
 if __name__ == "__main__" :
   # for i, row in solution :
   #   print((i//81), (i%81)//9, (i%9))
@@ -0,0 +1,27 @@
+import json
+import sys
+from typing import Optional, TextIO
+
+# Trace levels, every level also emits the events of the levels below it
+TRACE_OFF = 0
+TRACE_SEARCH = 1        # branches, backtracks and results of the search
+TRACE_PROPAGATION = 2   # forced placements, contradictions and strategy eliminations
+
+class Tracer :
+  def __init__(self, level:int=TRACE_SEARCH, stream:Optional[TextIO]=None, json_lines:bool=False) -> None :
+    """
+    Write the solver events up to `level` to `stream` (stderr by default),
+    either as `event key=value ...` text lines or as one JSON object per line
+    """
+    self.level = level
+    self.stream = stream if stream is not None else sys.stderr
+    self.json_lines = json_lines
+
+  def emit(self, event:str, **fields) -> None :
+    """
+    Write one event with its fields
+    """
+    if self.json_lines :
+      self.stream.write(json.dumps({"event": event, **fields}) + "\n")
+    else :
+      self.stream.write(" ".join([event] + [f"{key}={value}" for key, value in fields.items()]) + "\n")